@@ -0,0 +1,166 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import mock_gitlab
+from common import load_dora, repo_dir
+
+# Measured per run; for every one of them a higher value is worse
+metric_names = ('wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'requests', 'bytes')
+
+# Run the mock server in its own process so its CPU time and memory stay out of the measurements
+def serve(args, port_queue):
+    server = mock_gitlab.start_server(mock_gitlab.data_from_arguments(args), latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit)
+    port_queue.put(server.server_port)
+    multiprocessing.Event().wait()
+
+# Call one of the mock server's control endpoints (/__stats, /__reset)
+def server_call(base_url, path):
+    with urllib.request.urlopen(base_url + path) as response:
+        body = response.read()
+    return json.loads(body) if body else None
+
+# Peak resident set size of this process so far; ru_maxrss is in kilobytes on Linux and bytes on macOS
+def peak_rss_mb():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+# Stable fingerprint of a report, so runs that compare equal also produced the same numbers
+def report_digest(df):
+    return hashlib.sha256(df.to_csv(index=False, float_format='%.9g').encode()).hexdigest()[:16]
+
+# One end-to-end generate_reports run against the mock server, with a fresh (or kept) response cache
+def measure(dora, args, base_url, workdir, run):
+    dora.client = None
+    dora.cache_path = os.path.join(workdir, 'cache.sqlite' if args.warm_cache else f'cache-{run}.sqlite')
+    dora.commit_cache = None
+    dora.commit_cache_path = os.path.join(workdir, 'commits.sqlite' if args.warm_cache else f'commits-{run}.sqlite')
+    dora.state_path = os.path.join(workdir, 'state.sqlite')
+    end = mock_gitlab.now
+    start_date = (end - timedelta(days=args.window)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    end_date = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    server_call(base_url, '/__reset')
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    daily, monthly = dora.generate_reports(1, start_date, end_date, workers=args.workers, incremental=args.incremental, stream=args.stream)
+    wall = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    stats = server_call(base_url, '/__stats')
+    dora.get_client().close()
+
+    return {
+        'wall_seconds': wall,
+        'cpu_seconds': (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime),
+        'peak_rss_mb': peak_rss_mb(),
+        'requests': stats['requests'],
+        'bytes': stats['bytes'],
+        'not_modified': stats['not_modified'],
+        'throttled': stats['throttled'],
+        'endpoints': stats['endpoints'],
+        'daily_rows': len(daily),
+        'monthly_rows': len(monthly),
+        'digest': report_digest(daily)
+    }
+
+# Median of each metric over the runs; peak RSS is the high-water mark, so take the largest
+def summarize(runs):
+    summary = {name: statistics.median(run[name] for run in runs) for name in metric_names}
+    summary['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+    return summary
+
+# Commit the results were measured at, when running from a git checkout
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Print a metric-by-metric comparison; returns the metrics that got worse by more than the tolerance
+def compare(result, baseline, tolerance):
+    if baseline['config'] != result['config']:
+        print('Warning: baseline was recorded with a different configuration')
+    regressions = []
+    print(f"{'metric':<14}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name in metric_names:
+        old, new = baseline['summary'][name], result['summary'][name]
+        change = (new - old) / old if old else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<14}{old:>14.3f}{new:>14.3f}{change:>+10.1%}{flag}')
+    if baseline['runs'][0]['digest'] != result['runs'][0]['digest']:
+        print('Warning: report contents differ from the baseline')
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time generate_reports end to end against a local mock GitLab')
+    mock_gitlab.add_server_arguments(parser)
+    parser.add_argument('--script', default='dora-v5.py', help='dora script to benchmark')
+    parser.add_argument('--window', type=int, default=30, help='days analyzed, ending at the data set end')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--warm-cache', action='store_true', help='keep the response cache between runs')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='override a setting of the script, e.g. pipeline_ref=main (VALUE is JSON, or else a string)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare against results saved earlier with --save')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args, port_queue), daemon=True)
+    server.start()
+    base_url = f'http://127.0.0.1:{port_queue.get()}/api/v4'
+
+    dora = load_dora(args.script)
+    dora.base_url = base_url
+    for setting in args.set:
+        name, _, value = setting.partition('=')
+        if not hasattr(dora, name):
+            sys.exit(f'{args.script} has no setting {name}')
+        try:
+            setattr(dora, name, json.loads(value))
+        except ValueError:
+            setattr(dora, name, value)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            runs = []
+            for run in range(args.repeat):
+                runs.append(measure(dora, args, base_url, workdir, run))
+                print(f"run {run + 1}: {runs[-1]['wall_seconds']:.2f}s wall, {runs[-1]['cpu_seconds']:.2f}s CPU, "
+                      f"{runs[-1]['requests']} requests, {runs[-1]['bytes'] / 2 ** 20:.1f} MB, {runs[-1]['peak_rss_mb']:.0f} MB peak RSS")
+    finally:
+        server.terminate()
+
+    config = {k: v for k, v in vars(args).items() if k not in ('repeat', 'save', 'compare', 'tolerance')}
+    result = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'summary': summarize(runs),
+        'runs': runs
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(f"Regressed: {', '.join(regressions)}")
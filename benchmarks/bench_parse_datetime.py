@@ -0,0 +1,64 @@
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from common import load_dora
+
+dora = load_dora()
+
+# The strptime-with-fallback parser dora-v5.py used before, kept as the baseline
+def parse_datetime_strptime(date_str):
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Date format for '{date_str}' is not supported")
+
+# GitLab-style timestamps; about half lack fractional seconds, which forces the fallback path
+def sample_timestamps(count, distinct, seed=0):
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    pool = []
+    for _ in range(distinct):
+        moment = base + timedelta(seconds=rng.uniform(0, 365 * 86400))
+        if rng.random() < 0.5:
+            pool.append(moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}Z')
+        else:
+            pool.append(moment.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    return [rng.choice(pool) for _ in range(count)]
+
+# Best-of-repeat seconds per call for parser over values
+def time_per_call(parser, values, repeat):
+    return min(timeit.repeat(lambda: [parser(v) for v in values], number=1, repeat=repeat)) / len(values)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parse_datetime against the old strptime fallback loop')
+    parser.add_argument('--count', type=int, default=200000, help='timestamps parsed per run')
+    parser.add_argument('--distinct', type=int, default=20000, help='distinct timestamp strings among them')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    values = sample_timestamps(args.count, args.distinct)
+    assert all(dora.parse_datetime(v) == parse_datetime_strptime(v) for v in set(values))
+    # The offset forms parse to the same instant
+    assert dora.parse_datetime('2024-05-01T12:00:00.000+00:00') == dora.parse_datetime('2024-05-01T12:00:00.000Z')
+    assert dora.parse_datetime('2024-05-01T14:00:00+02:00') == dora.parse_datetime('2024-05-01T12:00:00Z')
+
+    baseline = time_per_call(parse_datetime_strptime, values, args.repeat)
+    uncached = time_per_call(dora.parse_datetime.__wrapped__, values, args.repeat)
+    dora.parse_datetime.cache_clear()
+    cached = time_per_call(dora.parse_datetime, values, args.repeat)
+    series = pd.Series(values)
+    vectorized = min(timeit.repeat(lambda: pd.to_datetime(series, utc=True, format='ISO8601'), number=1, repeat=args.repeat)) / len(values)
+
+    print(f"{args.count} timestamps, {args.distinct} distinct")
+    for label, seconds in (('strptime fallback (old)', baseline), ('fromisoformat', uncached),
+                           ('fromisoformat + memo', cached), ('pd.to_datetime (bulk)', vectorized)):
+        print(f"{label:<26}{seconds * 1e9:>10.0f} ns/call{baseline / seconds:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
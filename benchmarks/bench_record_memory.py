@@ -0,0 +1,94 @@
+import argparse
+import copy
+import gc
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+from common import load_dora
+
+dora = load_dora()
+
+# Payloads shaped like GitLab REST API responses, including the nested objects the metrics never read
+user = {
+    'id': 1, 'name': 'Administrator', 'username': 'root', 'state': 'active', 'locked': False,
+    'avatar_url': 'https://www.gravatar.com/avatar/e64c7d89f26bd1972efa854d13d7dd61?s=80&d=identicon',
+    'web_url': 'https://gitlab.example.com/root', 'created_at': '2015-12-21T13:14:24.077Z',
+    'bio': '', 'location': None, 'public_email': '', 'linkedin': '', 'twitter': '',
+    'website_url': '', 'organization': '', 'job_title': '', 'pronouns': None, 'bot': False
+}
+commit = {
+    'id': '0ff3ae198f8601a285adcf5c0fff204ee6fba5fd', 'short_id': '0ff3ae19', 'created_at': '2015-12-24T16:51:14.000+01:00',
+    'parent_ids': ['f9b2bc61d5ce0f3a37b47dfbb0fbea57e5f6f4f2'], 'title': 'Test the CI integration.',
+    'message': 'Test the CI integration.', 'author_name': 'Administrator', 'author_email': 'admin@example.com',
+    'authored_date': '2015-12-24T16:51:14.000+01:00', 'committer_name': 'Administrator',
+    'committer_email': 'admin@example.com', 'committed_date': '2015-12-24T16:51:14.000+01:00',
+    'trailers': {}, 'extended_trailers': {}, 'web_url': 'https://gitlab.example.com/group/project/-/commit/0ff3ae19'
+}
+pipeline = {
+    'id': 6, 'iid': 6, 'project_id': 1, 'sha': '0ff3ae198f8601a285adcf5c0fff204ee6fba5fd', 'ref': 'main',
+    'status': 'success', 'source': 'push', 'created_at': '2016-08-11T11:28:34.085Z', 'updated_at': '2016-08-11T11:32:35.169Z',
+    'web_url': 'https://gitlab.example.com/group/project/-/pipelines/6'
+}
+job = {
+    'id': 7, 'status': 'failed', 'stage': 'test', 'name': 'rspec:other', 'ref': 'main', 'tag': False, 'coverage': None,
+    'allow_failure': False, 'created_at': '2016-01-11T10:13:33.506Z', 'started_at': '2016-01-11T10:13:33.506Z',
+    'finished_at': '2016-01-11T10:15:10.506Z', 'erased_at': None, 'duration': 97.0, 'queued_duration': 0.121,
+    'user': user, 'commit': commit, 'pipeline': pipeline, 'failure_reason': 'script_failure',
+    'web_url': 'https://gitlab.example.com/group/project/-/jobs/7', 'project': {'ci_job_token_scope_enabled': False},
+    'artifacts': [{'file_type': 'trace', 'size': 1180, 'filename': 'job.log', 'file_format': None}],
+    'artifacts_file': {'filename': 'artifacts.zip', 'size': 1000}, 'artifacts_expire_at': '2016-01-23T17:54:27.895Z',
+    'tag_list': ['docker runner', 'ubuntu18'],
+    'runner': {'id': 32, 'description': '', 'ip_address': None, 'active': True, 'paused': False, 'is_shared': True,
+               'runner_type': 'instance_type', 'name': None, 'online': False, 'status': 'offline'},
+    'runner_manager': {'id': 1, 'system_id': 's_ae6a76fcedbe', 'version': '16.5.0', 'revision': '43b2dc3d',
+                       'platform': 'linux', 'architecture': 'amd64', 'created_at': '2024-05-01T10:12:02.507Z',
+                       'contacted_at': '2024-05-07T06:30:09.355Z', 'ip_address': '127.0.0.1', 'status': 'offline'}
+}
+deployment = {
+    'id': 41, 'iid': 1, 'ref': 'main', 'sha': '99d03678b90d914dbb1b109132516d71a4a03ea8',
+    'created_at': '2016-08-11T11:32:35.444Z', 'updated_at': '2016-08-11T11:34:01.123Z', 'status': 'success',
+    'user': user, 'environment': {'id': 9, 'name': 'production', 'external_url': 'https://about.gitlab.com'},
+    'deployable': {**job, 'name': 'deploy', 'stage': 'deploy', 'status': 'success'}
+}
+
+samples = {'pipelines': pipeline, 'jobs': job, 'deployments': deployment}
+
+# Distinct copies of a sample, decoded from JSON like a real page would be
+def decoded_records(sample, count):
+    base = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        record = copy.deepcopy(sample)
+        record['id'] = i
+        record['created_at'] = (base + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        records.append(record)
+    return json.loads(json.dumps(records))
+
+# Bytes per record still allocated after building records with build(), measured with tracemalloc
+def traced_bytes_per_record(build, count):
+    gc.collect()
+    tracemalloc.start()
+    records = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current / count
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per record: full GitLab JSON dicts versus compact records')
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'kind':<12}{'dict B/rec':>12}{'compact B/rec':>15}{'ratio':>8}   (tracemalloc; getsizeof estimate)")
+    for kind, sample in samples.items():
+        record_type = dora.record_types[kind]
+        payload = json.dumps(decoded_records(sample, args.count))
+        before = traced_bytes_per_record(lambda: json.loads(payload), args.count)
+        after = traced_bytes_per_record(lambda: [record_type.from_json(r) for r in json.loads(payload)], args.count)
+        report = dora.record_memory_report(decoded_records(sample, 1000), record_type)
+        print(f"{kind:<12}{before:>12.0f}{after:>15.0f}{before / after:>8.1f}   "
+              f"({report['bytes_before']:.0f} -> {report['bytes_after']:.0f})")
+
+if __name__ == '__main__':
+    main()
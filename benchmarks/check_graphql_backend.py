@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import tempfile
+from datetime import timedelta
+
+import mock_gitlab
+from bench_generate_reports import report_digest
+from common import load_dora
+
+# Checks that backend='graphql' reports the same daily totals as the REST backend, for every incident and
+# lead time source and with a single deployment environment, by running generate_reports both ways against
+# the mock GitLab's REST and GraphQL APIs
+modes = [
+    {'incident_source': incident_source, 'lead_time_source': lead_time_source, 'deployment_environment': None}
+    for incident_source in ('jobs', 'deployments') for lead_time_source in ('pipelines', 'commits')
+] + [{'incident_source': 'deployments', 'lead_time_source': 'commits', 'deployment_environment': 'production'}]
+
+# Longest deployment of the second data set checked: ten days, so more than a page of deployments created
+# before the window finish inside it
+long_deploy_minutes = 10 * 24 * 60
+
+# Daily report of one generate_reports run, with a fresh client and commit cache
+def daily_report(dora, backend, start_date, end_date, workdir):
+    dora.client = None
+    dora.commit_cache = None
+    dora.commit_cache_path = os.path.join(workdir, f'commits-{backend}.sqlite')
+    daily, _ = dora.generate_reports(1, start_date, end_date, workers=4, backend=backend)
+    dora.get_client().close()
+    return daily
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the REST and GraphQL backends of dora-v5.py against a local mock GitLab')
+    mock_gitlab.add_server_arguments(parser)
+    parser.add_argument('--window', type=int, default=30, help='days analyzed, ending at the data set end')
+    parser.set_defaults(projects=10, pipelines=200)
+    args = parser.parse_args()
+
+    dora = load_dora()
+    end = mock_gitlab.now
+    start_date = (end - timedelta(days=args.window)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    end_date = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    mismatches = []
+    for deploy_minutes in (args.deploy_minutes, long_deploy_minutes):
+        args.deploy_minutes = deploy_minutes
+        server = mock_gitlab.start_server(mock_gitlab.data_from_arguments(args), latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit)
+        dora.base_url = f'http://127.0.0.1:{server.server_port}/api/v4'
+        try:
+            for mode in modes:
+                for name, value in mode.items():
+                    setattr(dora, name, value)
+                with tempfile.TemporaryDirectory() as workdir:
+                    rest, graphql = (report_digest(daily_report(dora, backend, start_date, end_date, workdir)) for backend in ('rest', 'graphql'))
+                label = ', '.join(f'{name}={value}' for name, value in {'deploy_minutes': deploy_minutes, **mode}.items())
+                print(f"{label}: rest {rest}, graphql {graphql}{'' if rest == graphql else '  MISMATCH'}")
+                if rest != graphql:
+                    mismatches.append(label)
+        finally:
+            server.shutdown()
+    if mismatches:
+        sys.exit(f"GraphQL totals differ from REST for: {'; '.join(mismatches)}")
@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import mock_gitlab
+from common import load_dora
+
+# Checks the webhook ingestion path of dora-v5.py's service mode: replays the recorded hooks in webhooks.jsonl
+# (a pipeline, one of its jobs and its deployment, as GitLab sends them) into a MetricsService loaded from
+# the mock GitLab, and checks that they are stored without any request to GitLab and change the totals
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webhooks.jsonl')
+
+# What the recorded hooks add to project 1 on the day they happened
+expected = {'project_id': 1, 'date': '2025-12-31', 'deltas': {'pipelines': 1, 'deployments': 1, 'lead_time_count': 1, 'change_failures': 1}}
+
+# Project 1's daily totals on the fixtures' day
+def day_totals(service):
+    with service.lock:
+        daily_totals = service.daily_totals
+    row = daily_totals[(daily_totals['project_id'] == expected['project_id']) & (daily_totals['date'] == expected['date'])]
+    return {name: int(row[name].sum()) for name in expected['deltas']}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded webhooks into dora-v5.py's service mode against a local mock GitLab")
+    mock_gitlab.add_server_arguments(parser)
+    parser.add_argument('--webhooks', nargs='+', default=[fixtures], help='recorded webhook files (JSON lines of {"headers", "body"})')
+    parser.set_defaults(projects=4, pipelines=100)
+    args = parser.parse_args()
+
+    server = mock_gitlab.start_server(mock_gitlab.data_from_arguments(args), latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit)
+    mock_state = server.RequestHandlerClass.state
+    dora = load_dora()
+    dora.base_url = f'http://127.0.0.1:{server.server_port}/api/v4'
+    dora.incident_source, dora.lead_time_source = 'jobs', 'pipelines'
+    # The service's window ends now, so it has to reach back over the mock's whole history
+    history_days = (datetime.now(timezone.utc) - mock_gitlab.now).days + args.days + 1
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        dora.state_path = os.path.join(workdir, 'state.sqlite')
+        dora.cache_path = os.path.join(workdir, 'cache.sqlite')
+        service = dora.MetricsService(1, history_days=history_days, workers=4)
+        handler = type('BoundMetricsRequestHandler', (dora.MetricsRequestHandler,), {'service': service, 'secret': 'replay-secret'})
+        listener = dora.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        listener.daemon_threads = True
+        threading.Thread(target=listener.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{listener.server_port}/webhook'
+        try:
+            service.refresh()
+            if service.last_error:
+                sys.exit(f"Initial refresh failed: {service.last_error}")
+            before = day_totals(service)
+
+            # A wrong token must be refused and store nothing
+            dora.replay_webhooks(url, args.webhooks, 'wrong-secret')
+            if service.dirty:
+                failures.append('hooks with a wrong X-Gitlab-Token were stored')
+
+            requests_before = mock_state.stats['requests']
+            sent = dora.replay_webhooks(url, args.webhooks, 'replay-secret')
+            service.update_projects(sorted(service.dirty))
+            fetched = mock_state.stats['requests'] - requests_before
+            after = day_totals(service)
+        finally:
+            listener.shutdown()
+            listener.server_close()
+            server.shutdown()
+
+        pipeline = service.state.get(1, 'pipelines', 19999999)
+        deployment = service.state.get(1, 'deployments', 19999999)
+        jobs = sorted(service.state.load(1, 'jobs'), key=lambda job: job.id)[-3:]
+        service.close()
+
+    print(f"Replayed {sent} hooks, {fetched} GitLab requests; before {before}, after {after}")
+    if fetched:
+        failures.append(f'{fetched} GitLab requests while ingesting webhooks')
+    if pipeline is None or pipeline.status != 'success' or pipeline.updated_at != '2025-12-31T09:40:00.000Z':
+        failures.append(f'stored pipeline {pipeline}')
+    if [(job.id, job.status) for job in jobs] != [(159999992, 'success'), (159999993, 'failed'), (159999994, 'success')]:
+        failures.append(f'stored jobs {jobs}')
+    # The deployment keeps the time it was first seen running, and its SHA comes from commit_url
+    if deployment is None or deployment.created_at != '2025-12-31T09:41:00.000Z' or deployment.updated_at != '2025-12-31T09:48:30.000Z' \
+            or deployment.sha != 'ffffffff0123456789abcdef0123456789abcdef':
+        failures.append(f'stored deployment {deployment}')
+    for name, delta in expected['deltas'].items():
+        if after[name] - before[name] != delta:
+            failures.append(f'{name} changed by {after[name] - before[name]}, not {delta}')
+    if failures:
+        sys.exit(f"Webhook replay failed: {'; '.join(failures)}")
@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+# Root of the repository, one level up from this directory
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import one of the dora-*.py scripts as a module (their hyphenated names rule out a plain import)
+def load_dora(script='dora-v5.py'):
+    path = os.path.join(repo_dir, script)
+    name = os.path.splitext(script)[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
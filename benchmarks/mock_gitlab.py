@@ -0,0 +1,605 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Serves the GitLab REST endpoints the dora scripts call, over synthetic data generated from a seed:
+#   /groups/:id/projects, /groups/:id/subgroups, /projects/:id/pipelines,
+#   /projects/:id/pipelines/:id/jobs, /projects/:id/jobs, /projects/:id/deployments,
+#   /projects/:id/repository/compare and /projects/:id/repository/commits/:sha
+# Listings carry GitLab's pagination headers (offset and keyset), ETags and RateLimit-* headers.
+# POST /api/graphql answers the GraphQL queries dora-v5's GraphQL backend sends, over the same data,
+# and rejects queries above GitLab's complexity limit as GitLab does.
+
+# Synthetic data is placed in the days before this instant, so runs are reproducible
+now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# Record ids encode their parents: pipeline = project * stride + n, job = pipeline * jobs_stride + k
+stride = 10_000_000
+jobs_stride = 8
+job_names = ('build', 'test', 'deploy', 'restore')
+
+# GitLab stops counting (no X-Total / X-Total-Pages) above this many records
+count_limit = 10_000
+
+# GitLab's GraphQL limits: the most complexity a query may have, and the page size assumed for a
+# connection queried without first:
+max_complexity = 250
+graphql_page_size = 100
+
+# GitLab's timestamp format: UTC with milliseconds and a Z suffix
+def timestamp(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{dt.microsecond // 1000:03d}Z'
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+
+# Seeded generator: groups, projects and per-project records, produced on demand so the data set can
+# reach thousands of projects and millions of pipelines without being held in memory at once
+class DataSet:
+    def __init__(self, seed=0, groups=4, projects=100, pipelines=200, days=60, deploy_rate=0.5, failure_rate=0.2, merge_request_rate=0.5,
+                 deploy_minutes=10):
+        self.seed = seed
+        self.days = days
+        # Longest a deployment runs; days-long ones start before a window and finish inside it
+        self.deploy_minutes = deploy_minutes
+        self.pipelines_per_project = pipelines
+        self.deploy_rate = deploy_rate
+        self.failure_rate = failure_rate
+        self.merge_request_rate = merge_request_rate
+        self.project_count = projects
+        # Group 1 is the root; groups 2..groups+1 are its subgroups, and projects are spread over all of them
+        self.subgroups = {1: list(range(2, groups + 2))}
+        self.group_projects = {group_id: [] for group_id in range(1, groups + 2)}
+        for project_id in range(1, projects + 1):
+            self.group_projects[1 + project_id % (groups + 1)].append(project_id)
+        self.project_records = lru_cache(maxsize=64)(self.generate)
+        # Paging through a listing slices one cached list instead of filtering and sorting the history per page
+        self.listings = lru_cache(maxsize=256)(self.select)
+
+    # Project document as the groups/:id/projects listing returns it
+    def project(self, project_id):
+        return {
+            'id': project_id, 'name': f'project-{project_id}', 'path_with_namespace': f'bench/project-{project_id}',
+            'archived': project_id % 10 == 0, 'description': 'Synthetic benchmark project', 'default_branch': 'main',
+            'web_url': f'https://gitlab.example.com/bench/project-{project_id}', 'created_at': timestamp(now - timedelta(days=365))
+        }
+
+    # Projects of a group, plus those of its subgroups when asked to
+    def projects_in(self, group_id, include_subgroups=False):
+        group_ids = [group_id]
+        if include_subgroups:
+            group_ids += self.subgroups.get(group_id, [])
+        if not all(g in self.group_projects for g in group_ids):
+            raise KeyError(group_id)
+        return [self.project(p) for g in group_ids for p in self.group_projects[g]]
+
+    # Every pipeline, job and deployment of a project, newest first, as the REST API returns them, and
+    # the commits on main oldest first (each main pipeline builds one)
+    def generate(self, project_id):
+        rng = random.Random(self.seed * 1_000_003 + project_id)
+        # Commit times come from their own generator, so adding them left the other records unchanged
+        commit_rng = random.Random(-(self.seed * 1_000_003 + project_id))
+        span = self.days * 86400
+        starts = sorted(rng.uniform(0, span) for _ in range(self.pipelines_per_project))
+        pipelines, jobs, deployments, commits = [], [], [], []
+        for n, offset in enumerate(starts):
+            pipeline_id = project_id * stride + n
+            created = now - timedelta(seconds=span - offset)
+            updated = created + timedelta(minutes=rng.uniform(2, 90))
+            status = 'failed' if rng.random() < self.failure_rate else rng.choice(['success', 'success', 'success', 'canceled'])
+            # Merge request pipelines run on their own refs and never deploy
+            merge_request = rng.random() < self.merge_request_rate
+            ref = f'refs/merge-requests/{n + 1}/head' if merge_request else 'main'
+            pipeline = {
+                'id': pipeline_id, 'iid': n + 1, 'project_id': project_id, 'sha': f'{pipeline_id:040x}', 'ref': ref,
+                'status': status, 'source': 'merge_request_event' if merge_request else 'push', 'created_at': timestamp(created), 'updated_at': timestamp(updated),
+                'web_url': f'https://gitlab.example.com/bench/project-{project_id}/-/pipelines/{pipeline_id}'
+            }
+            pipelines.append(pipeline)
+            if not merge_request:
+                committed = created - timedelta(minutes=commit_rng.uniform(5, 2880))
+                commits.append({
+                    'id': pipeline['sha'], 'short_id': pipeline['sha'][:8], 'title': f'Change {n + 1}', 'message': f'Change {n + 1}\n',
+                    'author_name': 'bench', 'authored_date': timestamp(committed), 'committer_name': 'bench',
+                    'committed_date': timestamp(committed), 'created_at': timestamp(committed),
+                    'parent_ids': [commits[-1]['id']] if commits else [],
+                    'web_url': f'https://gitlab.example.com/bench/project-{project_id}/-/commit/{pipeline["sha"]}'
+                })
+            for k, name in enumerate(job_names):
+                started = created + timedelta(seconds=rng.uniform(1, 60))
+                finished = started + timedelta(minutes=rng.uniform(1, 30))
+                jobs.append({
+                    'id': pipeline_id * jobs_stride + k, 'status': 'failed' if rng.random() < self.failure_rate else 'success',
+                    'stage': name, 'name': name, 'ref': ref, 'tag': False, 'allow_failure': False,
+                    'created_at': timestamp(created), 'started_at': timestamp(started), 'finished_at': timestamp(finished),
+                    'duration': (finished - started).total_seconds(), 'user': {'id': 1, 'username': 'bench'},
+                    'pipeline': {'id': pipeline_id, 'project_id': project_id, 'sha': pipeline['sha'], 'ref': ref, 'status': status},
+                    'web_url': f'https://gitlab.example.com/bench/project-{project_id}/-/jobs/{pipeline_id * jobs_stride + k}'
+                })
+            if status == 'success' and not merge_request and rng.random() < self.deploy_rate:
+                deployed = updated + timedelta(minutes=rng.uniform(1, self.deploy_minutes))
+                deployments.append({
+                    'id': pipeline_id, 'iid': len(deployments) + 1, 'ref': 'main', 'sha': pipeline['sha'],
+                    'status': 'failed' if rng.random() < self.failure_rate else 'success',
+                    'environment': {'id': 1, 'name': rng.choice(['production', 'production', 'staging'])},
+                    'created_at': timestamp(updated), 'updated_at': timestamp(deployed), 'finished_at': timestamp(deployed),
+                    'deployable': {'id': pipeline_id * jobs_stride + 2, 'pipeline': {'id': pipeline_id}}
+                })
+        pipelines.reverse()
+        jobs.reverse()
+        deployments.reverse()
+        return {'pipelines': pipelines, 'jobs': jobs, 'deployments': deployments, 'commits': commits}
+
+    # Pipelines, jobs, deployments or commits of a project; unknown projects raise KeyError (a 404)
+    def records(self, project_id, kind):
+        if not 1 <= project_id <= self.project_count:
+            raise KeyError(project_id)
+        return self.project_records(project_id)[kind]
+
+    # Pipelines, jobs or deployments of a project as a listing query returns them, filtered and ordered;
+    # the pagination parameters are left out, so every page of a listing shares one cache entry
+    def listing(self, project_id, kind, query):
+        filters = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in query.items() if name not in page_parameters and value is not None
+        ))
+        return self.listings(project_id, kind, filters)
+
+    def select(self, project_id, kind, filters):
+        query = {name: list(value) if isinstance(value, tuple) else value for name, value in filters}
+        items = self.records(project_id, kind)
+        if kind == 'pipelines':
+            items = filter_updated(items, query)
+            if 'status' in query:
+                items = [p for p in items if p['status'] == query['status']]
+            if 'ref' in query:
+                items = [p for p in items if p['ref'] == query['ref']]
+            return order(items, query)
+        if kind == 'jobs':
+            scope = query.get('scope[]') or query.get('scope')
+            if scope:
+                scope = [scope] if isinstance(scope, str) else scope
+                items = [j for j in items if j['status'] in scope]
+            return items
+        items = filter_updated(items, query)
+        if 'environment' in query:
+            items = [d for d in items if d['environment']['name'] == query['environment']]
+        if 'status' in query:
+            statuses = [query['status']] if isinstance(query['status'], str) else query['status']
+            items = [d for d in items if d['status'] in statuses]
+        return order(items, query, default_desc=False)
+
+# Query parameters that pick a page of a listing rather than its records
+page_parameters = {'page', 'per_page', 'cursor', 'pagination'}
+
+# Filters GitLab applies to the listing endpoints, from the query string
+def filter_updated(items, query):
+    after, before = parse_timestamp(query.get('updated_after')), parse_timestamp(query.get('updated_before'))
+    if after or before:
+        items = [x for x in items if (not after or parse_timestamp(x['updated_at']) > after) and (not before or parse_timestamp(x['updated_at']) < before)]
+    return items
+
+# order_by/sort, left alone when the caller didn't ask for an order
+def order(items, query, default_desc=True):
+    if 'order_by' not in query and 'sort' not in query:
+        return items
+    key = query.get('order_by', 'id')
+    descending = query.get('sort', 'desc' if default_desc else 'asc') == 'desc'
+    return sorted(items, key=lambda x: x[key], reverse=descending)
+
+# Raised for a query the GraphQL stub can't answer; the message goes back in the response's errors
+class GraphQLError(Exception):
+    pass
+
+# Parser for the GraphQL the stub accepts: a single query of fields with aliases, arguments and nested
+# selections. Each field comes back as (alias, name, arguments, selections or None).
+class GraphQLParser:
+    token = re.compile(r'"(?:[^"\\]|\\.)*"|-?\d+|\w+|[{}()\[\]:]')
+
+    def __init__(self, text):
+        self.tokens = self.token.findall(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or expected is not None and token != expected:
+            raise GraphQLError(f'Parse error: expected {expected or "more input"}, got {token}')
+        self.position += 1
+        return token
+
+    def document(self):
+        if self.peek() == 'query':
+            self.take()
+            if self.peek() != '{':
+                self.take()
+        selections = self.selections()
+        if self.peek() is not None:
+            raise GraphQLError(f'Parse error: unexpected {self.peek()}')
+        return selections
+
+    def selections(self):
+        self.take('{')
+        fields = []
+        while self.peek() != '}':
+            fields.append(self.field())
+        self.take('}')
+        return fields
+
+    def field(self):
+        alias = name = self.take()
+        if self.peek() == ':':
+            self.take()
+            name = self.take()
+        arguments = {}
+        if self.peek() == '(':
+            self.take()
+            while self.peek() != ')':
+                key = self.take()
+                self.take(':')
+                arguments[key] = self.value()
+            self.take(')')
+        return alias, name, arguments, self.selections() if self.peek() == '{' else None
+
+    def value(self):
+        token = self.take()
+        if token == '[':
+            items = []
+            while self.peek() != ']':
+                items.append(self.value())
+            self.take(']')
+            return items
+        if token == '{':
+            fields = {}
+            while self.peek() != '}':
+                key = self.take()
+                self.take(':')
+                fields[key] = self.value()
+            self.take('}')
+            return fields
+        if token.startswith('"'):
+            return json.loads(token)
+        if token.lstrip('-').isdigit():
+            return int(token)
+        return {'true': True, 'false': False, 'null': None}.get(token, token)
+
+# Connections of the stubbed schema, whose selections GitLab counts once per node a page may hold
+connection_fields = {'projects', 'pipelines', 'jobs', 'environments', 'deployments'}
+
+# Complexity of a selection: 1 per field, with a connection's selections multiplied by its page size
+def complexity(selections):
+    total = 0
+    for _, name, arguments, fields in selections:
+        inner = complexity(fields) if fields else 0
+        if name in connection_fields:
+            inner *= arguments.get('first', graphql_page_size)
+        total += 1 + inner
+    return total
+
+# One page of a connection; cursors are offsets into the full list
+def connection(items, node, first=graphql_page_size, after=None, **_):
+    offset = int(after or 0)
+    chunk = items[offset:offset + first]
+    more = offset + first < len(items)
+    return {'pageInfo': {'hasNextPage': more, 'endCursor': str(offset + len(chunk))}, 'nodes': [node(item) for item in chunk]}
+
+def gid(kind, record_id):
+    return f'gid://gitlab/{kind}/{record_id}'
+
+def pipeline_node(pipeline):
+    return {'id': gid('Ci::Pipeline', pipeline['id']), 'status': pipeline['status'].upper(), 'createdAt': pipeline['created_at'], 'updatedAt': pipeline['updated_at']}
+
+def job_node(job):
+    return {
+        'id': gid('Ci::Build', job['id']), 'name': job['name'], 'status': job['status'].upper(), 'createdAt': job['created_at'],
+        'startedAt': job['started_at'], 'finishedAt': job['finished_at'], 'pipeline': {'id': gid('Ci::Pipeline', job['pipeline']['id'])}
+    }
+
+def deployment_node(deployment):
+    return {
+        'id': gid('Deployment', deployment['id']), 'status': deployment['status'].upper(), 'sha': deployment['sha'],
+        'createdAt': deployment['created_at'], 'updatedAt': deployment['updated_at'], 'finishedAt': deployment['finished_at']
+    }
+
+# A project as a GraphQL object: plain fields, and connections as functions of their arguments
+def project_object(data, project_id):
+    def pipelines(updatedAfter=None, updatedBefore=None, ref=None, **page):
+        items = data.listing(project_id, 'pipelines', {'updated_after': updatedAfter, 'updated_before': updatedBefore, 'ref': ref})
+        return connection(items, pipeline_node, **page)
+
+    def jobs(statuses=None, **page):
+        scope = [status.lower() for status in statuses] if statuses is not None else None
+        return connection(data.listing(project_id, 'jobs', {'scope[]': scope}), job_node, **page)
+
+    # Deployments by createdAt (the default, newest first) or finishedAt, which GitLab only sorts on when
+    # the statuses are all finished ones
+    def deployments(name, statuses=None, orderBy=None, **page):
+        (field, direction), = (orderBy or {'createdAt': 'DESC'}).items()
+        if field == 'finishedAt' and not set(statuses or ['ALL']) <= {'SUCCESS', 'FAILED', 'CANCELED'}:
+            raise GraphQLError('Ordering deployments by finishedAt requires filtering on finished statuses')
+        status = [status.lower() for status in statuses] if statuses is not None else None
+        order_by = {'createdAt': 'created_at', 'finishedAt': 'finished_at'}[field]
+        items = data.listing(project_id, 'deployments', {'environment': name, 'status': status, 'order_by': order_by, 'sort': direction.lower()})
+        return connection(items, deployment_node, **page)
+
+    names = sorted({d['environment']['name'] for d in data.records(project_id, 'deployments')})
+
+    def environment_object(name):
+        return {'name': name, 'deployments': lambda **arguments: deployments(name, **arguments)}
+
+    def environments(name=None, **page):
+        return connection([n for n in names if name is None or n == name], environment_object, **page)
+
+    return {
+        'id': gid('Project', project_id), 'fullPath': f'bench/project-{project_id}', 'pipelines': pipelines, 'jobs': jobs,
+        'environments': environments, 'environment': lambda name: environment_object(name) if name in names else None
+    }
+
+# Evaluate a selection against an object, calling function-valued fields with the field's arguments
+def resolve(value, selections):
+    if isinstance(value, list):
+        return [resolve(item, selections) for item in value]
+    if value is None or selections is None:
+        return value
+    result = {}
+    for alias, name, arguments, fields in selections:
+        if name not in value:
+            raise GraphQLError(f"Field '{name}' doesn't exist on this type")
+        item = value[name]
+        result[alias] = resolve(item(**arguments) if callable(item) else item, fields)
+    return result
+
+# Answer a GraphQL query with the body GitLab would send back
+def execute_graphql(data, query):
+    try:
+        selections = GraphQLParser(query).document()
+        score = complexity(selections)
+        if score > max_complexity:
+            raise GraphQLError(f'Query has complexity of {score}, which exceeds max complexity of {max_complexity}')
+        root = {'projects': lambda ids, **page: connection(
+            [int(i.rsplit('/', 1)[1]) for i in ids if 1 <= int(i.rsplit('/', 1)[1]) <= data.project_count],
+            lambda project_id: project_object(data, project_id), **page
+        )}
+        return {'data': resolve(root, selections)}
+    except (GraphQLError, TypeError) as err:
+        return {'data': None, 'errors': [{'message': str(err)}]}
+
+# Request counters, rate limit window and injected latency shared by all handler threads
+class ServerState:
+    def __init__(self, data, latency=0.0, jitter=0.0, rate_limit=0):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.window_start = 0.0
+        self.window_used = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'not_modified': 0, 'throttled': 0, 'not_found': 0, 'endpoints': {}}
+
+    # Record a response: totals, bytes of body sent, and a count per endpoint pattern
+    def count(self, endpoint, status, size):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += size
+            self.stats['endpoints'][endpoint] = self.stats['endpoints'].get(endpoint, 0) + 1
+            if status == 304:
+                self.stats['not_modified'] += 1
+            elif status == 429:
+                self.stats['throttled'] += 1
+            elif status == 404:
+                self.stats['not_found'] += 1
+
+    # Fixed one-second window, like GitLab's per-user limits; returns (allowed, remaining, reset)
+    def take(self):
+        if not self.rate_limit:
+            return True, None, None
+        with self.lock:
+            current = time.time()
+            if current - self.window_start >= 1:
+                self.window_start, self.window_used = current, 0
+            self.window_used += 1
+            return self.window_used <= self.rate_limit, max(0, self.rate_limit - self.window_used), int(self.window_start) + 1
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in [*headers, *self.extra_headers]:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    # One page of a listing: offset pagination with X-* headers, or keyset pagination with a Link header
+    def send_page(self, path, items, query):
+        per_page = min(int(query.get('per_page', 20)), 100)
+        headers = [('Content-Type', 'application/json'), ('X-Per-Page', str(per_page))]
+        if query.get('pagination') == 'keyset':
+            offset = int(query.get('cursor', 0))
+            chunk = items[offset:offset + per_page]
+            if offset + per_page < len(items):
+                link_query = {k: v for k, v in query.items() if k != 'page'}
+                link_query['cursor'] = offset + per_page
+                link = f'http://{self.headers["Host"]}/api/v4{path}?{urlencode(link_query, doseq=True)}'
+                headers.append(('Link', f'<{link}>; rel="next"'))
+        else:
+            page = max(1, int(query.get('page', 1)))
+            chunk = items[(page - 1) * per_page:page * per_page]
+            more = page * per_page < len(items)
+            headers += [('X-Page', str(page)), ('X-Next-Page', str(page + 1) if more else ''), ('X-Prev-Page', str(page - 1) if page > 1 else '')]
+            if len(items) <= count_limit:
+                headers += [('X-Total', str(len(items))), ('X-Total-Pages', str(max(1, -(-len(items) // per_page))))]
+        body = json.dumps(chunk).encode()
+        etag = 'W/"%08x"' % zlib.crc32(body)
+        headers.append(('ETag', etag))
+        if self.headers.get('If-None-Match') == etag:
+            return 304, self.send_body(304, headers=[('ETag', etag)])
+        return 200, self.send_body(200, body, headers)
+
+    # A single JSON document, such as a commit or a comparison
+    def send_document(self, document):
+        return 200, self.send_body(200, json.dumps(document).encode(), [('Content-Type', 'application/json')])
+
+    # Control endpoints (/__stats, /__reset) first, then latency, the rate limit and the API itself
+    def do_GET(self):
+        state = self.state
+        url = urlparse(self.path)
+        path = url.path.removeprefix('/api/v4')
+        query = {k: v[0] if len(v) == 1 else v for k, v in parse_qs(url.query).items()}
+        self.extra_headers = []
+
+        if path == '/__stats':
+            self.send_body(200, json.dumps(state.stats).encode(), [('Content-Type', 'application/json')])
+            return
+        if path == '/__reset':
+            state.reset()
+            self.send_body(204)
+            return
+
+        endpoint = re.sub(r'/\d+(?=/|$)', '/:id', re.sub(r'/[0-9a-f]{40}(?=/|$)', '/:sha', path))
+        if not self.admit(endpoint):
+            return
+        try:
+            status, size = self.route(path, query)
+        except (KeyError, ValueError):
+            status, size = 404, self.send_body(404, b'{"message":"404 Not Found"}', [('Content-Type', 'application/json')])
+        state.count(endpoint, status, size)
+
+    # The GraphQL endpoint; its latency, rate limit and counters are shared with the REST API
+    def do_POST(self):
+        state = self.state
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.extra_headers = []
+        if urlparse(self.path).path != '/api/graphql':
+            size = self.send_body(404, b'{"message":"404 Not Found"}', [('Content-Type', 'application/json')])
+            state.count(urlparse(self.path).path, 404, size)
+            return
+        if not self.admit('/graphql'):
+            return
+        try:
+            query = json.loads(body)['query']
+        except (ValueError, KeyError, TypeError):
+            size = self.send_body(400, b'{"message":"400 Bad Request"}', [('Content-Type', 'application/json')])
+            state.count('/graphql', 400, size)
+            return
+        status, size = self.send_document(execute_graphql(state.data, query))
+        state.count('/graphql', status, size)
+
+    # Injected latency and the rate limit, before any API request; False once the request was answered with a 429
+    def admit(self, endpoint):
+        state = self.state
+        if state.latency or state.jitter:
+            time.sleep(state.latency + random.uniform(0, state.jitter))
+
+        allowed, remaining, reset = state.take()
+        if remaining is not None:
+            self.extra_headers = [('RateLimit-Limit', str(state.rate_limit)), ('RateLimit-Remaining', str(remaining)), ('RateLimit-Reset', str(reset))]
+        if not allowed:
+            size = self.send_body(429, b'Retry later', [('Retry-After', str(max(1, reset - int(time.time()))))])
+            state.count(endpoint, 429, size)
+        return allowed
+
+    # Dispatch a GitLab API path to the listing it serves; unmatched paths raise KeyError (a 404)
+    def route(self, path, query):
+        data = self.state.data
+        match = re.fullmatch(r'/groups/(\d+)/projects', path)
+        if match:
+            projects = data.projects_in(int(match.group(1)), query.get('include_subgroups') == 'true')
+            if query.get('archived') == 'false':
+                projects = [p for p in projects if not p['archived']]
+            return self.send_page(path, projects, query)
+        match = re.fullmatch(r'/groups/(\d+)/subgroups', path)
+        if match:
+            group_id = int(match.group(1))
+            if group_id not in data.group_projects:
+                raise KeyError(group_id)
+            return self.send_page(path, [{'id': g, 'name': f'group-{g}'} for g in data.subgroups.get(group_id, [])], query)
+        match = re.fullmatch(r'/projects/(\d+)/pipelines', path)
+        if match:
+            return self.send_page(path, data.listing(int(match.group(1)), 'pipelines', query), query)
+        match = re.fullmatch(r'/projects/(\d+)/pipelines/(\d+)/jobs', path)
+        if match:
+            project_id, pipeline_id = int(match.group(1)), int(match.group(2))
+            jobs = data.records(project_id, 'jobs')
+            if pipeline_id // stride != project_id:
+                raise KeyError(pipeline_id)
+            return self.send_page(path, [j for j in jobs if j['id'] // jobs_stride == pipeline_id], query)
+        match = re.fullmatch(r'/projects/(\d+)/jobs', path)
+        if match:
+            return self.send_page(path, data.listing(int(match.group(1)), 'jobs', query), query)
+        match = re.fullmatch(r'/projects/(\d+)/deployments', path)
+        if match:
+            return self.send_page(path, data.listing(int(match.group(1)), 'deployments', query), query)
+        match = re.fullmatch(r'/projects/(\d+)/repository/compare', path)
+        if match:
+            # Commits reachable from 'to' but not from 'from'; history on main is linear
+            commits = data.records(int(match.group(1)), 'commits')
+            positions = {commit['id']: i for i, commit in enumerate(commits)}
+            first, last = positions[query['from']], positions[query['to']]
+            shipped = commits[first + 1:last + 1]
+            return self.send_document({
+                'commit': shipped[-1] if shipped else None, 'commits': shipped, 'diffs': [],
+                'compare_timeout': False, 'compare_same_ref': query['from'] == query['to']
+            })
+        match = re.fullmatch(r'/projects/(\d+)/repository/commits/([0-9a-f]{40})', path)
+        if match:
+            commits = {commit['id']: commit for commit in data.records(int(match.group(1)), 'commits')}
+            return self.send_document(commits[match.group(2)])
+        raise KeyError(path)
+
+# Start the server on a background thread; port 0 picks a free port (see server.server_port)
+def start_server(data, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, rate_limit=0):
+    handler = type('BoundHandler', (Handler,), {'state': ServerState(data, latency, jitter, rate_limit)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Command line options shared with the benchmarks that start this server
+def add_server_arguments(parser):
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--groups', type=int, default=4, help='subgroups under the root group 1')
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--pipelines', type=int, default=200, help='pipelines per project')
+    parser.add_argument('--days', type=int, default=60, help='days of history the pipelines are spread over')
+    parser.add_argument('--deploy-minutes', type=float, default=10, help='longest a deployment runs')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per second before answering 429 (0: unlimited)')
+
+def data_from_arguments(args):
+    return DataSet(args.seed, args.groups, args.projects, args.pipelines, args.days, deploy_minutes=args.deploy_minutes)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock GitLab REST and GraphQL API serving seeded synthetic data')
+    add_server_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8929)
+    args = parser.parse_args()
+
+    server = start_server(data_from_arguments(args), args.host, args.port, args.latency, args.jitter, args.rate_limit)
+    print(f'Serving http://{args.host}:{server.server_port}/api/v4 (root group 1, {args.projects} projects)', flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
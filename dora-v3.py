@@ -1,57 +1,215 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
+
+# Decode responses with orjson when it is installed, falling back to the standard library
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Define constants
 GITLAB_URL = 'https://gitlab.example.com'  # Replace with your GitLab instance URL
 PRIVATE_TOKEN = 'YOUR_PRIVATE_ACCESS_TOKEN'  # Replace with your GitLab private access token
+POOL_SIZE = 64  # Keep-alive connections kept open to the GitLab host
+REQUEST_TIMEOUT = 60  # Seconds to wait for GitLab to respond
+MAX_WORKERS = POOL_SIZE  # Analytics calls in flight at once, across all groups
+CACHE_TTL = 300  # Seconds an analytics response is served from memory before it is requested again
+
+# Seconds each analytics endpoint may take before it is reported as timed out (REQUEST_TIMEOUT when not listed).
+# This is a wall-clock deadline from the start of the dashboard, and also the read timeout of the request.
+ENDPOINT_TIMEOUTS = {
+    "ci_cd_analytics": 30,
+    "contribution_analytics": 30,
+    "devops_adoption": 15,
+    "insights": 30,
+    "productivity_analytics": 30,
+    "repository_analytics": 15,
+}
+
+# Shared HTTP client: one pooled keep-alive Session with the auth headers set once
+class GitLabClient:
+    def __init__(self, private_token, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "PRIVATE-TOKEN": private_token,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, timeout=None):
+        response = self.session.get(url, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return json_loads(response.content)
+
+    def close(self):
+        self.session.close()
+
+client = None
+client_lock = threading.Lock()
+
+# Return the shared client, creating it from the current settings on first use
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            client = GitLabClient(PRIVATE_TOKEN)
+        return client
 
-# Function to make a request to the GitLab API
-def make_request(url):
-    headers = {"PRIVATE-TOKEN": PRIVATE_TOKEN}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+# In-memory cache of successful responses by URL, shared by all threads; errors are never cached
+class ResponseCache:
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    # Cached response for url, or None when missing or older than the TTL
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def put(self, url, data):
+        with self.lock:
+            self.entries[url] = (time.monotonic(), data)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+response_cache = ResponseCache()
+
+# Function to make a request to the GitLab API, answered from the response cache when fresh
+def make_request(url, timeout=None):
+    data = response_cache.get(url)
+    if data is None:
+        data = get_client().get(url, timeout)
+        response_cache.put(url, data)
+    return data
 
 # Function to get CI/CD analytics
-def get_ci_cd_analytics(group_id):
+def get_ci_cd_analytics(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/ci_cd_analytics"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
 
 # Function to get contribution analytics
-def get_contribution_analytics(group_id):
+def get_contribution_analytics(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/contribution_analytics"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
 
 # Function to get devops adoption
-def get_devops_adoption(group_id):
+def get_devops_adoption(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/devops_adoption"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
 
 # Function to get insights
-def get_insights(group_id):
+def get_insights(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/insights"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
 
 # Function to get productivity analytics
-def get_productivity_analytics(group_id):
+def get_productivity_analytics(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/productivity_analytics"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
 
 # Function to get repository analytics
-def get_repository_analytics(group_id):
+def get_repository_analytics(group_id, timeout=None):
     url = f"{GITLAB_URL}/api/v4/groups/{group_id}/repository_analytics"  # Adjust endpoint as needed
-    return make_request(url)
+    return make_request(url, timeout)
+
+# Analytics endpoints by the name they are reported under
+ANALYTICS = {
+    "ci_cd_analytics": get_ci_cd_analytics,
+    "contribution_analytics": get_contribution_analytics,
+    "devops_adoption": get_devops_adoption,
+    "insights": get_insights,
+    "productivity_analytics": get_productivity_analytics,
+    "repository_analytics": get_repository_analytics,
+}
+
+# Outcome of a call that did not finish within its timeout
+def timed_out(timeout):
+    return {"status": "timeout", "data": None, "error": f"No response within {timeout} seconds"}
+
+# Outcome of a call that was still queued when the dashboard gave up on it
+def not_started():
+    return {"status": "not_started", "data": None, "error": "Not started: every worker was busy with calls past their deadline"}
+
+# Call one analytics endpoint of a group, returning its outcome instead of raising:
+# {"status": "ok" | "timeout" | "error" | "not_started", "data": response or None, "error": message or None}
+def fetch_analytics(name, group_id):
+    timeout = ENDPOINT_TIMEOUTS.get(name, REQUEST_TIMEOUT)
+    try:
+        data = ANALYTICS[name](group_id, timeout)
+    except requests.exceptions.Timeout:
+        return timed_out(timeout)
+    except Exception as err:
+        return {"status": "error", "data": None, "error": str(err)}
+    return {"status": "ok", "data": data, "error": None}
+
+# Get every analytics endpoint of many groups at once. The calls run concurrently over the shared client,
+# max_workers at a time, and each has until its ENDPOINT_TIMEOUTS deadline, counted from when it starts.
+# A call still running at its deadline is reported as "timeout" and left to finish in the background;
+# calls still queued once every worker is stuck on such a call are reported as "not_started", so a slow
+# endpoint only affects its own entries. Returns {group_id: {endpoint name: fetch_analytics result}}.
+def get_analytics_for_groups(group_ids, max_workers=MAX_WORKERS):
+    started = {}
+
+    def run(group_id, name):
+        started[group_id, name] = time.monotonic()
+        return fetch_analytics(name, group_id)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {
+        (group_id, name): executor.submit(run, group_id, name)
+        for group_id in group_ids for name in ANALYTICS
+    }
+    results = {group_id: {} for group_id in group_ids}
+    abandoned = []
+    try:
+        while pending:
+            now = time.monotonic()
+            deadlines = {}
+            for (group_id, name), future in list(pending.items()):
+                timeout = ENDPOINT_TIMEOUTS.get(name, REQUEST_TIMEOUT)
+                if future.done():
+                    results[group_id][name] = future.result()
+                elif (group_id, name) not in started:
+                    continue
+                elif now >= started[group_id, name] + timeout:
+                    results[group_id][name] = timed_out(timeout)
+                    abandoned.append(future)
+                else:
+                    deadlines[group_id, name] = started[group_id, name] + timeout
+                    continue
+                del pending[group_id, name]
+
+            # Every worker is stuck on a call past its deadline, so the queued calls would only start once
+            # those finish in the background; they are dropped instead
+            if pending and not deadlines and sum(not future.done() for future in abandoned) >= max_workers:
+                for (group_id, name), future in list(pending.items()):
+                    if future.cancel():
+                        results[group_id][name] = not_started()
+                        del pending[group_id, name]
+            # Wake for the next completion or deadline, and often enough to see calls start
+            wait(pending.values(), timeout=min([0.1] + [deadline - now for deadline in deadlines.values()]), return_when=FIRST_COMPLETED)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {group_id: {name: results[group_id][name] for name in ANALYTICS} for group_id in group_ids}
 
 # Main function to get all analytics for a group
 def get_all_analytics(group_id):
-    analytics = {
-        "ci_cd_analytics": get_ci_cd_analytics(group_id),
-        "contribution_analytics": get_contribution_analytics(group_id),
-        "devops_adoption": get_devops_adoption(group_id),
-        "insights": get_insights(group_id),
-        "productivity_analytics": get_productivity_analytics(group_id),
-        "repository_analytics": get_repository_analytics(group_id),
-    }
-    return analytics
+    return get_analytics_for_groups([group_id])[group_id]
 
 # Example usage
 if __name__ == "__main__":
@@ -59,7 +217,8 @@ if __name__ == "__main__":
     try:
         analytics = get_all_analytics(group_id)
         print(analytics)
-    except requests.exceptions.HTTPError as err:
-        print(f"HTTP error occurred: {err}")
+        failed = {name: result["error"] for name, result in analytics.items() if result["status"] != "ok"}
+        if failed:
+            print(f"Incomplete analytics: {failed}")
     except Exception as err:
         print(f"An error occurred: {err}")
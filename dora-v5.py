@@ -1,7 +1,49 @@
+import argparse
+import bisect
+import cProfile
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
 import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
+from urllib.parse import parse_qs, urlsplit
+
+# Decode responses with orjson when it is installed, falling back to the standard library
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# pyarrow is only needed for the Parquet raw-data store
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
 
 # Define your GitLab personal access token
 access_token = 'YOUR_ACCESS_TOKEN_HERE'
@@ -9,172 +51,2309 @@ access_token = 'YOUR_ACCESS_TOKEN_HERE'
 # Define the GitLab API endpoint
 base_url = 'https://gitlab.com/api/v4'
 
+# Number of projects analyzed concurrently
+max_workers = 8
+
+# Keep-alive connections kept open to the GitLab host; sized for concurrent workers
+http_pool_size = 32
+
+# Seconds to wait for GitLab to respond before giving up on a request
+request_timeout = 60
+
+# Records requested per page and pages fetched in parallel once the page count is known
+per_page = 100
+page_workers = 4
+
+# Records totaled per compute_daily_totals call when streaming (stream=True); bounds streaming memory,
+# while larger batches spread the fixed cost of each call over more records
+stream_batch_size = 5000
+
+# GraphQL backend: endpoint (derived from base_url when None), steps per query and the most nodes per
+# connection page. Pages shrink and queries carry fewer steps as needed to stay within GitLab's query
+# complexity limit (250 for authenticated requests on GitLab.com).
+graphql_url = None
+graphql_batch_size = 10
+graphql_page_size = 20
+graphql_max_complexity = 250
+
+# Adaptive request scheduling: in-flight requests grow additively up to max_in_flight and halve on a 429
+initial_in_flight = 8
+max_in_flight = http_pool_size
+max_retries = 5
+retry_backoff = 1.0  # Base seconds for jittered exponential backoff
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Local response cache, off by default; set cache_path (e.g. '.dora_cache.sqlite') to keep responses on disk.
+# Entries are keyed by full URL and all expire after cache_ttl. Listings carry the window's updated_after/
+# updated_before, and keyset job pages a cursor that moves whenever new jobs arrive, so the cache only helps
+# when the same window is requested again (reruns of a fixed --start/--end, sharded retries, the benchmarks).
+# Hourly reruns with a moving end never repeat a listing URL; use incremental=True for those.
+cache_path = None
+cache_ttl = 3600  # Seconds before a cached listing is revalidated with its ETag
+cache_max_bytes = 512 * 1024 * 1024
+
+# Distinct timestamp strings remembered by parse_datetime (0 disables the memo). The memo is sized once, when
+# the script is loaded, so changing this afterwards (e.g. bench_generate_reports.py --set) has no effect
+datetime_cache_size = 65536
+
+# Per-project records and watermarks used by incremental runs (generate_reports(..., incremental=True))
+state_path = '.dora_state.sqlite'
+
+# Service mode: days of daily totals kept in memory, seconds between refreshes, and where the query API listens
+service_history_days = 90
+service_refresh_interval = 900
+service_host = '127.0.0.1'
+service_port = 8080
+
+# Projects that sent a webhook within the last service_reconcile_interval seconds are polled only that often,
+# to catch events the hooks missed; between polls their totals are recomputed from the stored records. Set
+# service_webhooks_configured when the whole group sends webhooks, so that every project is polled that rarely.
+service_reconcile_interval = 6 * 3600
+service_webhooks_configured = False
+
+# Webhook ingestion (POST /webhook in service mode): the secret GitLab must send as X-Gitlab-Token (None accepts
+# any request, so serve refuses it unless listening on a loopback address), and how long events are batched
+# before the affected projects' aggregates are recomputed
+webhook_secret = None
+webhook_batch_seconds = 1.0
+
+# Filters pushed down to GitLab so records no metric uses are never transferred. None keeps every record;
+# e.g. deployment_environment = 'production' counts production deployments only, deployment_status = 'success'
+# successful ones only, and pipeline_ref = 'main' leaves merge request and branch pipelines out of every metric
+deployment_environment = None
+deployment_status = None
+pipeline_ref = None
+
+# Where change failures and restores come from: 'jobs' counts failed jobs of successful pipelines and the run time
+# of successful restore jobs, which means listing every job; 'deployments' derives both from each environment's
+# deployment statuses alone (failed deployments over all deployments, and failure -> recovery intervals), so no
+# jobs are fetched at all. With deployment_status set there are no failures to see, so keep it None for 'deployments'.
+incident_source = 'jobs'
+
+# Where lead time for changes comes from: 'pipelines' is each successful pipeline's duration (updated_at - created_at);
+# 'commits' is DORA lead time, from each commit's committed_date to the successful deployment that first shipped it
+# to its environment (set deployment_environment to count production only). The commits between an environment's
+# consecutive deployments come from one compare request, and commit timestamps are kept in commit_cache_path
+# (None keeps them for the run only). The first deployment of each environment in the window counts its own commit.
+lead_time_source = 'pipelines'
+commit_cache_path = '.dora_commits.sqlite'
+
+# Lead time and time to restore percentiles come from log-bucketed sketches: each reported percentile is
+# within sketch_relative_accuracy of the true one; durations under sketch_min_hours count as sketch_min_hours
+sketch_relative_accuracy = 0.01
+sketch_min_hours = 1e-6
+reported_quantiles = (0.5, 0.9)
+
+# Upper bounds (seconds) of the request latency histogram buckets
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Profiling of each project's worker in collect_daily_totals: cProfile stats are written here when set, and
+# trace_memory records each project's peak traced allocation. Both profilers are process-wide (cProfile
+# since Python 3.12), so while either is on the projects are analyzed one at a time and the run is slower.
+profile_dir = None
+trace_memory = False
+
+# Raised when GitLab answers with an error status, after any retries
+class GitLabAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Failed to fetch data from GitLab API. Status code: {status_code}")
+        self.status_code = status_code
+
+# Endpoint pattern of a request URL, e.g. /projects/:id/pipelines, used to label metrics
+def endpoint_label(url):
+    path = urlsplit(url).path
+    path = path[path.index('/api/v4') + len('/api/v4'):] if '/api/v4' in path else path
+    path = re.sub(r'/[0-9a-f]{40}(?=/|$)', '/:sha', path)
+    return re.sub(r'/\d+(?=/|$)', '/:id', path)
+
+# Counters for one run: requests, latency histograms, bytes, retries and cache lookups per endpoint,
+# plus calls, wall time and CPU time per analysis stage. Exported as Prometheus text or a JSON summary.
+class RunMetrics:
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.requests = defaultdict(int)  # (endpoint, status) -> count
+            self.latency = defaultdict(lambda: {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0})
+            self.bytes = defaultdict(int)
+            self.retries = defaultdict(int)  # (endpoint, reason) -> count
+            self.cache = defaultdict(int)  # (endpoint, result) -> count
+            self.stages = defaultdict(lambda: {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_bytes': 0})
+
+    # One HTTP attempt; status is the response code, or 'error' when the connection failed
+    def record_request(self, url, status, seconds, size=0):
+        endpoint = endpoint_label(url)
+        with self.lock:
+            self.requests[endpoint, str(status)] += 1
+            histogram = self.latency[endpoint]
+            histogram['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            histogram['max'] = max(histogram['max'], seconds)
+            self.bytes[endpoint] += size
+
+    def record_retry(self, url, reason):
+        with self.lock:
+            self.retries[endpoint_label(url), str(reason)] += 1
+
+    # result is 'hit' (fresh entry), 'revalidated' (304 from GitLab) or 'miss'
+    def record_cache(self, url, result):
+        with self.lock:
+            self.cache[endpoint_label(url), result] += 1
+
+    # Time a stage. CPU time is the calling thread's, so stages run by worker threads add up per thread.
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self.lock:
+                totals = self.stages[name]
+                totals['calls'] += 1
+                totals['wall_seconds'] += wall
+                totals['cpu_seconds'] += cpu
+
+    def record_peak_memory(self, name, peak_bytes):
+        with self.lock:
+            self.stages[name]['peak_bytes'] = max(self.stages[name]['peak_bytes'], peak_bytes)
+
+    # JSON-friendly summary of the run so far
+    def summary(self):
+        with self.lock:
+            endpoints = defaultdict(lambda: {'requests': 0, 'statuses': {}, 'bytes': 0, 'retries': {}, 'cache': {}})
+            for (endpoint, status), count in self.requests.items():
+                endpoints[endpoint]['requests'] += count
+                endpoints[endpoint]['statuses'][status] = count
+            for endpoint, size in self.bytes.items():
+                endpoints[endpoint]['bytes'] = size
+            for (endpoint, reason), count in self.retries.items():
+                endpoints[endpoint]['retries'][reason] = count
+            for (endpoint, result), count in self.cache.items():
+                endpoints[endpoint]['cache'][result] = count
+            for endpoint, histogram in self.latency.items():
+                endpoints[endpoint]['latency'] = {
+                    'count': histogram['count'],
+                    'mean_seconds': histogram['sum'] / histogram['count'],
+                    'max_seconds': histogram['max'],
+                    'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], itertools.accumulate(histogram['buckets'])))
+                }
+            return {
+                'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec='seconds'),
+                'elapsed_seconds': time.time() - self.started_at,
+                'requests': sum(self.requests.values()),
+                'bytes': sum(self.bytes.values()),
+                'endpoints': dict(endpoints),
+                'stages': {name: {k: v for k, v in totals.items() if v or k != 'peak_bytes'} for name, totals in self.stages.items()}
+            }
+
+    # Prometheus text exposition format
+    def prometheus(self):
+        def labels(**values):
+            return '{' + ','.join(f'{name}="{value}"' for name, value in values.items()) + '}'
+
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+            lines.extend(f'{name}{suffix} {value}' for suffix, value in samples)
+
+        with self.lock:
+            metric('dora_http_requests_total', 'counter', 'GitLab API requests by endpoint and status.',
+                   [(labels(endpoint=e, status=s), n) for (e, s), n in sorted(self.requests.items())])
+            histogram_samples = []
+            for endpoint, histogram in sorted(self.latency.items()):
+                bounds = [str(b) for b in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, itertools.accumulate(histogram['buckets'])):
+                    histogram_samples.append((f'_bucket{labels(endpoint=endpoint, le=bound)}', count))
+                histogram_samples.append((f'_sum{labels(endpoint=endpoint)}', histogram['sum']))
+                histogram_samples.append((f'_count{labels(endpoint=endpoint)}', histogram['count']))
+            metric('dora_http_request_duration_seconds', 'histogram', 'GitLab API request latency.', histogram_samples)
+            metric('dora_http_response_bytes_total', 'counter', 'Response body bytes received by endpoint.',
+                   [(labels(endpoint=e), n) for e, n in sorted(self.bytes.items())])
+            metric('dora_http_retries_total', 'counter', 'Retried GitLab API requests by endpoint and reason.',
+                   [(labels(endpoint=e, reason=r), n) for (e, r), n in sorted(self.retries.items())])
+            metric('dora_cache_lookups_total', 'counter', 'Response cache lookups by endpoint and result.',
+                   [(labels(endpoint=e, result=r), n) for (e, r), n in sorted(self.cache.items())])
+            for field, help_text in (('calls', 'Times each analysis stage ran.'),
+                                     ('wall_seconds', 'Wall time spent in each analysis stage.'),
+                                     ('cpu_seconds', 'CPU time spent in each analysis stage.')):
+                name = 'dora_stage_calls_total' if field == 'calls' else f'dora_stage_{field}_total'
+                metric(name, 'counter', help_text, [(labels(stage=stage), totals[field]) for stage, totals in sorted(self.stages.items())])
+        return '\n'.join(lines) + '\n'
+
+    # Write the JSON summary and/or the Prometheus text to files
+    def write(self, json_path=None, prometheus_path=None):
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+        if prometheus_path:
+            with open(prometheus_path, 'w') as f:
+                f.write(self.prometheus())
+
+# Metrics of the current run, filled in by the client and the analysis stages
+run_metrics = RunMetrics()
+
+# Time a block as a stage and, according to profile_dir and trace_memory, profile it with cProfile
+# (stats written to profile_dir/<stage>-<key>.prof) and record its peak traced memory
+@contextmanager
+def profiled(stage, key):
+    profiler = cProfile.Profile() if profile_dir else None
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        with run_metrics.stage(stage):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_dir, f'{stage}-{key}.prof'))
+        if tracing:
+            run_metrics.record_peak_memory(stage, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+# Central gate for requests: AIMD concurrency, rate-limit pauses and cheapest-first ordering
+class RequestScheduler:
+    def __init__(self, limit=initial_in_flight, max_limit=max_in_flight):
+        self.cond = threading.Condition()
+        self.limit = float(limit)
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.paused_until = 0.0
+
+    # Block until a slot is free; lower priority values are served first
+    def acquire(self, priority=0):
+        with self.cond:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                pause = self.paused_until - time.time()
+                if pause <= 0 and self.waiting[0] == ticket and self.in_flight < int(self.limit):
+                    break
+                self.cond.wait(pause if pause > 0 else None)
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            self.cond.notify_all()
+
+    # Free a slot and adapt: +1 slot per window of successes, halve on throttling
+    def release(self, headers=None, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            # Hold everything back until the window resets once the remaining budget is used up;
+            # missing or malformed headers are ignored
+            try:
+                remaining, reset = int(headers['RateLimit-Remaining']), float(headers['RateLimit-Reset'])
+            except (TypeError, KeyError, ValueError):
+                remaining = reset = None
+            if remaining is not None and remaining <= int(self.limit):
+                self.paused_until = max(self.paused_until, reset)
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.cond.notify_all()
+
+# Cheap requests go first: single objects before listings, and job listings last
+def request_priority(url):
+    path = url.split('?', 1)[0]
+    if path.endswith('/jobs'):
+        return 2
+    if path.endswith(('/pipelines', '/deployments', '/projects', '/graphql')):
+        return 1
+    return 0
+
+# Seconds to wait before retrying, from Retry-After when GitLab sends it, else jittered exponential backoff
+def retry_delay(attempt, headers=None):
+    retry_after = headers.get('Retry-After') if headers is not None else None
+    if retry_after and retry_after.isdigit():
+        return int(retry_after) + random.uniform(0, 1)
+    return random.uniform(0, min(60, retry_backoff * 2 ** attempt))
+
+# Decoded response body plus the headers needed for pagination
+ApiResponse = namedtuple('ApiResponse', ['data', 'headers'])
+
+# Response headers worth keeping alongside a cached body
+cached_headers = ('ETag', 'Link', 'X-Next-Page', 'X-Page', 'X-Per-Page', 'X-Total', 'X-Total-Pages')
+
+# Cached response as read back from the store
+CacheEntry = namedtuple('CacheEntry', ['etag', 'headers', 'body', 'expires_at'])
+
+# Persistent SQLite cache of GitLab responses keyed by the full request URL
+class ResponseCache:
+    def __init__(self, path, ttl=cache_ttl, max_bytes=cache_max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, etag TEXT, headers TEXT, body BLOB, '
+            'size INTEGER, expires_at REAL, accessed_at REAL)'
+        )
+        # Older caches kept some responses with no expiry; revalidate those like the rest
+        self.conn.execute('UPDATE responses SET expires_at = 0 WHERE expires_at IS NULL')
+        self.size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT etag, headers, body, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        etag, headers, body, expires_at = row
+        return CacheEntry(etag, json.loads(headers), body, expires_at)
+
+    def put(self, key, headers, body):
+        kept = {name: headers[name] for name in cached_headers if name in headers}
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, kept.get('ETag'), json.dumps(kept), body, len(body), expires_at, time.time())
+            )
+            self.size += len(body) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    # Push the expiry of a revalidated (304 Not Modified) entry forward
+    def refresh(self, key):
+        with self.lock:
+            self.conn.execute(
+                'UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?',
+                (time.time() + self.ttl, time.time(), key)
+            )
+
+    # Drop least recently used entries until under max_bytes
+    def evict(self):
+        rows = self.conn.execute(
+            'SELECT key, size FROM responses ORDER BY accessed_at'
+        ).fetchall()
+        for key, size in rows:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.size -= size
+
+    def close(self):
+        self.conn.close()
+
+# Shared HTTP client: one pooled keep-alive Session with the auth headers set once
+class GitLabClient:
+    def __init__(self, base_url, access_token, pool_size=http_pool_size, timeout=request_timeout, cache=None, scheduler=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = cache
+        self.scheduler = scheduler or RequestScheduler(max_limit=pool_size)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip'
+        })
+        # pool_block makes extra threads wait for a free connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, endpoint, params=None):
+        # Keyset pagination hands back absolute URLs for the next page
+        url = endpoint if endpoint.startswith('http') else f'{self.base_url}{endpoint}'
+        url = requests.Request('GET', url, params=params).prepare().url
+
+        entry = self.cache.get(url) if self.cache else None
+        if entry and entry.expires_at > time.time():
+            run_metrics.record_cache(url, 'hit')
+            return ApiResponse(json_loads(entry.body), CaseInsensitiveDict(entry.headers))
+
+        # Stale entries are revalidated; GitLab answers 304 when nothing changed
+        headers = {'If-None-Match': entry.etag} if entry and entry.etag else None
+        response = self.send(url, headers)
+        if response.status_code == 304 and entry:
+            run_metrics.record_cache(url, 'revalidated')
+            self.cache.refresh(url)
+            return ApiResponse(json_loads(entry.body), CaseInsensitiveDict(entry.headers))
+        if response.status_code != 200:
+            raise GitLabAPIError(response.status_code)
+
+        data = json_loads(response.content)
+        if self.cache:
+            run_metrics.record_cache(url, 'miss')
+            self.cache.put(url, response.headers, response.content)
+        return ApiResponse(data, response.headers)
+
+    # POST a JSON payload (used for GraphQL) and decode the JSON answer; never cached
+    def post(self, url, payload):
+        response = self.send(url, json_body=payload)
+        if response.status_code != 200:
+            raise GitLabAPIError(response.status_code)
+        return json_loads(response.content)
+
+    # Send a request through the scheduler, retrying throttled, failed and dropped requests
+    def send(self, url, headers=None, json_body=None):
+        priority = request_priority(url)
+        for attempt in range(max_retries + 1):
+            self.scheduler.acquire(priority)
+            started = time.perf_counter()
+            response = None
+            try:
+                try:
+                    if json_body is not None:
+                        response = self.session.post(url, json=json_body, headers=headers, timeout=self.timeout)
+                    else:
+                        response = self.session.get(url, headers=headers, timeout=self.timeout)
+                # Dropped connections, timeouts, bodies cut off mid-transfer, undecodable encodings, ...
+                except requests.RequestException as err:
+                    run_metrics.record_request(url, 'error', time.perf_counter() - started)
+                    if attempt == max_retries:
+                        raise
+                    run_metrics.record_retry(url, type(err).__name__)
+                else:
+                    run_metrics.record_request(url, response.status_code, time.perf_counter() - started, len(response.content))
+            finally:
+                # Every acquire is matched by a release, whatever happened; errors back off like throttling
+                throttled = response is None or response.status_code == 429
+                self.scheduler.release(response.headers if response is not None else None, throttled)
+            if response is None:
+                time.sleep(retry_delay(attempt))
+                continue
+
+            if response.status_code not in retry_statuses or attempt == max_retries:
+                return response
+            run_metrics.record_retry(url, response.status_code)
+            delay = retry_delay(attempt, response.headers)
+            if throttled:
+                # The whole instance is over its limit, so every worker waits, not just this one
+                self.scheduler.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+client = None
+client_lock = threading.Lock()
+
+# Return the shared client, creating it from the current settings on first use
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            cache = ResponseCache(cache_path) if cache_path else None
+            client = GitLabClient(base_url, access_token, cache=cache)
+        return client
+
 # Function to fetch data from GitLab API
 def fetch_gitlab_data(endpoint, params=None):
-    headers = {
-        'Authorization': f'Bearer {access_token}'
-    }
-    response = requests.get(f'{base_url}{endpoint}', headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to fetch data from GitLab API. Status code: {response.status_code}")
+    return get_client().get(endpoint, params).data
+
+# Return the rel="next" URL from a Link header, used by keyset pagination
+def next_link(headers):
+    for link in parse_header_links(headers.get('Link', '')):
+        if link.get('rel') == 'next':
+            return link['url']
+    return None
+
+# Yield every page of a listing endpoint in order, driven by GitLab's pagination headers
+# stop_when(page) lets callers end a newest-first walk early; a parallel burst then wastes at most page_workers requests
+def iter_pages(endpoint, params=None, keyset=False, stop_when=None):
+    client = get_client()
+    params = dict(params or {})
+    params.setdefault('per_page', per_page)
+    if keyset:
+        params['pagination'] = 'keyset'
+
+    first = client.get(endpoint, {**params, 'page': 1})
+    yield first.data
+    if stop_when and stop_when(first.data):
+        return
+
+    # Keyset pagination: follow the Link header until it runs out
+    url = next_link(first.headers) if keyset else None
+    if url:
+        while url:
+            response = client.get(url)
+            yield response.data
+            if stop_when and stop_when(response.data):
+                return
+            url = next_link(response.headers)
+        return
 
-# Fetch all projects in a group recursively
-def fetch_group_projects(group_id):
-    projects = []
+    # Page count known up front: fetch pages 2..N in parallel, never more than page_workers
+    # ahead of the consumer so a slow consumer holds the fetching back
+    total_pages = int(first.headers.get('X-Total-Pages') or 0)
+    if total_pages > 1:
+        fetch_page = lambda page: client.get(endpoint, {**params, 'page': page}).data
+        remaining = iter(range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=page_workers) as executor:
+            pending = deque(executor.submit(fetch_page, page) for page in itertools.islice(remaining, page_workers))
+            while pending:
+                data = pending.popleft().result()
+                page = next(remaining, None)
+                if page is not None:
+                    pending.append(executor.submit(fetch_page, page))
+                yield data
+                if stop_when and stop_when(data):
+                    for future in pending:
+                        future.cancel()
+                    return
+        return
+
+    # GitLab omits X-Total-Pages for very large collections; walk X-Next-Page until it is empty
+    if 'X-Next-Page' in first.headers:
+        next_page = first.headers['X-Next-Page']
+        while next_page:
+            response = client.get(endpoint, {**params, 'page': next_page})
+            yield response.data
+            if stop_when and stop_when(response.data):
+                return
+            next_page = response.headers.get('X-Next-Page')
+        return
+
+    # No pagination headers at all: keep going while pages come back full
     page = 1
-    while True:
-        params = {'page': page, 'per_page': 100}
-        data = fetch_gitlab_data(f'/groups/{group_id}/projects', params)
-        if not data:
-            break
-        projects.extend(data)
+    data = first.data
+    while len(data) >= params['per_page'] and not (stop_when and stop_when(data)):
         page += 1
+        data = client.get(endpoint, {**params, 'page': page}).data
+        yield data
+
+# Lists of up to size consecutive items of an iterable
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+# Marks the end of a prefetch stream; errors raised by the producer are passed through as-is
+prefetch_done = object()
+
+# Run an iterator on a background thread, handing items over a bounded queue so fetching
+# overlaps with computing but never runs more than depth items ahead of the consumer
+def prefetch(iterable, depth=page_workers):
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def offer(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not offer(item):
+                    return
+            offer(prefetch_done)
+        except Exception as err:
+            offer(err)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is prefetch_done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+# Project fields kept from discovery; the rest of the GitLab payload is dropped
+project_fields = ('id', 'name', 'path_with_namespace')
+
+# Compact record keeping only the fields the metrics read, built as soon as a page is decoded
+# so the full GitLab JSON (user, commit, runner, artifacts, ...) is dropped right away
+class Record:
+    __slots__ = ()
+    interned = ('status', 'name')  # Low-cardinality strings shared between records
+
+    # Records stored before a field was added are shorter; their missing trailing fields are None
+    def __init__(self, *values):
+        for field, value in itertools.zip_longest(self.__slots__, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*(cls.field_from_json(data, field) for field in cls.__slots__))
+
+    @classmethod
+    def field_from_json(cls, data, field):
+        value = data.get(field)
+        return sys.intern(value) if field in cls.interned and isinstance(value, str) else value
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __repr__(self):
+        return f"{type(self).__name__}{self.values()}"
+
+class Pipeline(Record):
+    __slots__ = ('id', 'status', 'created_at', 'updated_at')
 
-    subgroups = fetch_gitlab_data(f'/groups/{group_id}/subgroups')
-    for subgroup in subgroups:
-        projects.extend(fetch_group_projects(subgroup['id']))
+class Job(Record):
+    __slots__ = ('id', 'pipeline_id', 'name', 'status', 'created_at', 'started_at', 'finished_at')
 
-    return projects
+    @classmethod
+    def field_from_json(cls, data, field):
+        if field == 'pipeline_id':
+            return data['pipeline']['id']
+        return super().field_from_json(data, field)
+
+class Deployment(Record):
+    __slots__ = ('id', 'created_at', 'updated_at', 'status', 'environment', 'sha')
+
+    @classmethod
+    def field_from_json(cls, data, field):
+        if field == 'environment':
+            environment = data.get('environment')
+            return sys.intern(environment['name']) if environment else None
+        return super().field_from_json(data, field)
+
+record_types = {'pipelines': Pipeline, 'jobs': Job, 'deployments': Deployment}
+
+# Approximate bytes held by an object and everything it references
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, Record):
+        size += sum(deep_sizeof(value, seen) for value in obj.values())
+    return size
+
+# Average bytes per record for raw GitLab dicts versus their compact projection
+def record_memory_report(raw_records, record_type):
+    compact = [record_type.from_json(record) for record in raw_records]
+    count = max(len(raw_records), 1)
+    before = deep_sizeof(raw_records) / count
+    after = deep_sizeof(compact) / count
+    return {'records': len(raw_records), 'bytes_before': before, 'bytes_after': after, 'ratio': before / after if after else 0}
+
+# stop_when for newest-first walks: true once a page is empty or its last record is older than cutoff.
+# Listings already filtered by time (updated_after) end on their own; this guards the ones that are not.
+def page_ends_before(field, cutoff):
+    return lambda page: not page or parse_datetime(page[-1][field]) < cutoff
+
+# Yield all projects in a group and its nested subgroups, deduplicated by id
+def iter_group_projects(group_id, skip_archived=False):
+    # include_subgroups lists the whole tree as one paginated listing, so pages come back in parallel
+    params = {'include_subgroups': 'true', 'simple': 'true'}
+    if skip_archived:
+        params['archived'] = 'false'
+
+    seen = set()
+    for page in iter_pages(f'/groups/{group_id}/projects', params):
+        for project in page:
+            if project['id'] not in seen:
+                seen.add(project['id'])
+                yield {field: project.get(field) for field in project_fields}
+
+# Fetch all projects in a group and its nested subgroups
+def fetch_group_projects(group_id, skip_archived=False):
+    return list(iter_group_projects(group_id, skip_archived))
+
+# Yield deployment data
+def iter_deployments(project_id, start_date, end_date):
+    # The deployments API filters on updated_at (created_after is not a supported filter)
+    params = {'updated_after': start_date, 'updated_before': end_date, 'order_by': 'updated_at', 'sort': 'desc'}
+    if deployment_environment:
+        params['environment'] = deployment_environment
+    if deployment_status:
+        params['status'] = deployment_status
+    stop_when = page_ends_before('updated_at', parse_datetime(start_date))
+    for page in iter_pages(f'/projects/{project_id}/deployments', params, stop_when=stop_when):
+        yield from map(Deployment.from_json, page)
 
 # Fetch deployment data
 def fetch_deployments(project_id, start_date, end_date):
-    deployments = []
-    page = 1
-    while True:
-        params = {'page': page, 'per_page': 100, 'created_after': start_date, 'created_before': end_date}
-        data = fetch_gitlab_data(f'/projects/{project_id}/deployments', params)
-        if not data:
-            break
-        deployments.extend(data)
-        page += 1
-    return deployments
+    return list(iter_deployments(project_id, start_date, end_date))
+
+# Yield project pipelines
+def iter_pipelines(project_id, start_date, end_date):
+    params = {'updated_after': start_date, 'updated_before': end_date, 'order_by': 'updated_at', 'sort': 'desc'}
+    if pipeline_ref:
+        params['ref'] = pipeline_ref
+    stop_when = page_ends_before('updated_at', parse_datetime(start_date))
+    for page in iter_pages(f'/projects/{project_id}/pipelines', params, stop_when=stop_when):
+        yield from map(Pipeline.from_json, page)
 
 # Fetch project pipelines
 def fetch_pipelines(project_id, start_date, end_date):
-    pipelines = []
-    page = 1
-    while True:
-        params = {'page': page, 'per_page': 100, 'updated_after': start_date, 'updated_before': end_date}
-        data = fetch_gitlab_data(f'/projects/{project_id}/pipelines', params)
-        if not data:
-            break
-        pipelines.extend(data)
-        page += 1
-    return pipelines
+    return list(iter_pipelines(project_id, start_date, end_date))
+
+# Yield project jobs in the given scopes, newest first, down to jobs created at created_after
+def iter_project_jobs(project_id, created_after, scope=None):
+    params = {'scope[]': scope} if scope else {}
+    # Jobs are listed by descending id, so once a page reaches past the cutoff the rest is older still
+    stop_when = page_ends_before('created_at', created_after)
+    for page in iter_pages(f'/projects/{project_id}/jobs', params, keyset=True, stop_when=stop_when):
+        for job in page:
+            if parse_datetime(job['created_at']) >= created_after:
+                yield Job.from_json(job)
+
+# Fetch all project jobs in the given scopes, down to jobs created at created_after
+def fetch_project_jobs(project_id, created_after, scope=None):
+    return list(iter_project_jobs(project_id, created_after, scope))
 
-# Fetch pipeline jobs
-def fetch_pipeline_jobs(project_id, pipeline_id):
-    jobs = fetch_gitlab_data(f'/projects/{project_id}/pipelines/{pipeline_id}/jobs')
-    return jobs
+# Local store of previously fetched records and per-project high-water marks for incremental runs
+class SyncState:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # synced_from is where the stored records start; watermark is the newest updated_at seen
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS watermarks ('
+            'project_id TEXT, resource TEXT, synced_from TEXT, watermark TEXT, '
+            'PRIMARY KEY (project_id, resource))'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'project_id TEXT, resource TEXT, id INTEGER, parent_id INTEGER, sort_key TEXT, body TEXT, '
+            'PRIMARY KEY (project_id, resource, id))'
+        )
+        # The settings each project's stored records were fetched under (see sync_fingerprint)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fingerprints (project_id TEXT PRIMARY KEY, fingerprint TEXT)')
 
-# Parse datetime with flexible handling of formats
+    def get_fingerprint(self, project_id):
+        with self.lock:
+            row = self.conn.execute('SELECT fingerprint FROM fingerprints WHERE project_id = ?', (str(project_id),)).fetchone()
+        return row[0] if row else None
+
+    # Forget a project's records and watermarks, noting the settings its next records are fetched under
+    def reset(self, project_id, fingerprint):
+        project_id = str(project_id)
+        with self.lock:
+            self.conn.execute('DELETE FROM records WHERE project_id = ?', (project_id,))
+            self.conn.execute('DELETE FROM watermarks WHERE project_id = ?', (project_id,))
+            self.conn.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?)', (project_id, fingerprint))
+
+    def get_watermark(self, project_id, resource):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT synced_from, watermark FROM watermarks WHERE project_id = ? AND resource = ?',
+                (str(project_id), resource)
+            ).fetchone()
+        return row or (None, None)
+
+    def set_watermark(self, project_id, resource, synced_from, watermark):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)',
+                (str(project_id), resource, synced_from, watermark)
+            )
+
+    # Insert or replace records by id; sort_key is the timestamp used for pruning
+    def upsert(self, project_id, resource, records, sort_field, parent_field=None):
+        rows = [
+            (str(project_id), resource, r.id, getattr(r, parent_field) if parent_field else None, getattr(r, sort_field), json.dumps(r.values()))
+            for r in records
+        ]
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def get(self, project_id, resource, id_):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT body FROM records WHERE project_id = ? AND resource = ? AND id = ?', (str(project_id), resource, id_)
+            ).fetchone()
+        return record_types[resource](*json.loads(row[0])) if row else None
+
+    def load(self, project_id, resource):
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT body FROM records WHERE project_id = ? AND resource = ?', (str(project_id), resource)
+            ).fetchall()
+        record_type = record_types[resource]
+        # Stores written before records were compacted hold full GitLab JSON objects
+        return [
+            record_type.from_json(value) if isinstance(value, dict) else record_type(*value)
+            for value in (json.loads(body) for (body,) in rows)
+        ]
+
+    # Drop pipelines and deployments last updated before the window, and jobs of pipelines no longer kept
+    def prune(self, project_id, before):
+        project_id = str(project_id)
+        with self.lock:
+            for resource in ('pipelines', 'deployments'):
+                rows = self.conn.execute(
+                    'SELECT id, sort_key FROM records WHERE project_id = ? AND resource = ?', (project_id, resource)
+                ).fetchall()
+                stale = [(project_id, resource, id_) for id_, key in rows if parse_datetime(key) < before]
+                self.conn.executemany('DELETE FROM records WHERE project_id = ? AND resource = ? AND id = ?', stale)
+            self.conn.execute(
+                "DELETE FROM records WHERE project_id = ? AND resource = 'jobs' AND parent_id NOT IN "
+                "(SELECT id FROM records WHERE project_id = ? AND resource = 'pipelines')",
+                (project_id, project_id)
+            )
+
+    def close(self):
+        self.conn.close()
+
+# The settings that decide which records are fetched: the push-down filters leave records out, and
+# incident_source decides whether jobs are fetched at all
+def sync_fingerprint():
+    return json.dumps([pipeline_ref, deployment_environment, deployment_status, incident_source])
+
+# Bring a project's stored records up to end_date, fetching only what changed since its watermarks.
+# Records stored under other settings (see sync_fingerprint) are dropped and fetched again.
+def sync_project_records(state, project_id, start_date, end_date):
+    start = parse_datetime(start_date)
+    fingerprint = sync_fingerprint()
+    if state.get_fingerprint(project_id) != fingerprint:
+        state.reset(project_id, fingerprint)
+    new_pipelines = []
+    for resource, fetch in (('pipelines', fetch_pipelines), ('deployments', fetch_deployments)):
+        synced_from, watermark = state.get_watermark(project_id, resource)
+        # Stored records only help if they reach back to the start of this window
+        if synced_from is None or start < parse_datetime(synced_from):
+            fetch_from = start_date
+        else:
+            fetch_from = watermark if watermark and parse_datetime(watermark) > start else start_date
+
+        fetched = fetch(project_id, fetch_from, end_date)
+        state.upsert(project_id, resource, fetched, 'updated_at')
+        if fetched:
+            newest = max(fetched, key=lambda r: parse_datetime(r.updated_at)).updated_at
+            if not watermark or parse_datetime(newest) > parse_datetime(watermark):
+                watermark = newest
+        state.set_watermark(project_id, resource, start_date, watermark)
+        if resource == 'pipelines':
+            new_pipelines = fetched
+
+    # Only pipelines new or changed since the last run need their jobs listed
+    jobs = fetch_jobs_for_pipelines(project_id, new_pipelines)
+    state.upsert(project_id, 'jobs', jobs, 'created_at', parent_field='pipeline_id')
+    state.prune(project_id, start)
+
+    return {resource: state.load(project_id, resource) for resource in ('pipelines', 'jobs', 'deployments')}
+
+# Parse any GitLab ISO-8601 timestamp ('Z' or '+00:00' style offsets, with or without fractions)
+# into a naive UTC datetime; repeated strings are answered from a bounded memo
+@lru_cache(maxsize=datetime_cache_size)
 def parse_datetime(date_str):
-    for fmt in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
-        try:
-            return datetime.strptime(date_str, fmt)
-        except ValueError:
+    try:
+        # Most GitLab timestamps end in 'Z', which is already UTC (and unreadable by fromisoformat before 3.11)
+        if date_str.endswith('Z'):
+            return datetime.fromisoformat(date_str[:-1])
+        parsed = datetime.fromisoformat(date_str)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Date format for '{date_str}' is not supported")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+# Fetch the jobs of successful pipelines, which CFR and MTTR are computed from unless incident_source is 'deployments'
+def fetch_jobs_for_pipelines(project_id, pipelines):
+    successful = [p for p in pipelines if p.status == 'success']
+    if not successful or incident_source != 'jobs':
+        return []
+    oldest = min(parse_datetime(p.created_at) for p in successful)
+    return fetch_project_jobs(project_id, oldest, scope=['failed', 'success'])
+
+# Fetch everything needed to compute a project's DORA metrics over a window
+def fetch_project_records(project_id, start_date, end_date):
+    with run_metrics.stage('fetch_deployments'):
+        deployments = fetch_deployments(project_id, start_date, end_date)
+    with run_metrics.stage('fetch_pipelines'):
+        pipelines = fetch_pipelines(project_id, start_date, end_date)
+    # List the project's jobs once and index them later, instead of one jobs request per pipeline
+    with run_metrics.stage('fetch_jobs'):
+        jobs = fetch_jobs_for_pipelines(project_id, pipelines)
+    return {'pipelines': pipelines, 'jobs': jobs, 'deployments': deployments}
+
+# Persistent commit timestamps, shared by every project: commits are keyed by SHA alone, since forks share
+# their upstream's history, and each resolved range keeps the SHAs it contains, so neither is ever fetched twice
+class CommitCache:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY, committed_at TEXT)')
+        # from_sha is '' for a range holding just the deployed commit
+        self.conn.execute('CREATE TABLE IF NOT EXISTS ranges (from_sha TEXT, to_sha TEXT, shas TEXT, PRIMARY KEY (from_sha, to_sha))')
+
+    # Commit timestamps of a range, or None when it was never resolved
+    def get_range(self, from_sha, to_sha):
+        with self.lock:
+            row = self.conn.execute('SELECT shas FROM ranges WHERE from_sha = ? AND to_sha = ?', (from_sha, to_sha)).fetchone()
+            if row is None:
+                return None
+            shas = json.loads(row[0])
+            timestamps = dict(self.conn.execute(
+                f"SELECT sha, committed_at FROM commits WHERE sha IN ({', '.join('?' * len(shas))})", shas
+            ).fetchall())
+        return [timestamps[sha] for sha in shas if sha in timestamps]
+
+    # Store a range's commits as (sha, committed_at) pairs
+    def put_range(self, from_sha, to_sha, commits):
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO commits VALUES (?, ?)', commits)
+            self.conn.execute('INSERT OR REPLACE INTO ranges VALUES (?, ?, ?)', (from_sha, to_sha, json.dumps([sha for sha, _ in commits])))
+
+    def close(self):
+        self.conn.close()
+
+commit_cache = None
+commit_cache_lock = threading.Lock()
+
+# Return the shared commit cache, opening it on first use
+def get_commit_cache():
+    global commit_cache
+    with commit_cache_lock:
+        if commit_cache is None:
+            commit_cache = CommitCache(commit_cache_path or ':memory:')
+        return commit_cache
+
+# Commits a deployment of to_sha shipped after one of from_sha, oldest first, as (sha, committed_at) pairs: one
+# compare request for the whole range, or the deployed commit alone when there is no earlier deployment
+def fetch_commit_range(project_id, from_sha, to_sha):
+    if from_sha:
+        commits = fetch_gitlab_data(f'/projects/{project_id}/repository/compare', {'from': from_sha, 'to': to_sha})['commits']
+    else:
+        commits = [fetch_gitlab_data(f'/projects/{project_id}/repository/commits/{to_sha}')]
+    return [(commit['id'], commit['committed_date']) for commit in commits]
+
+# Commit timestamps of many (project_id, from_sha, to_sha) ranges, keyed by (from_sha, to_sha). Ranges are
+# deduplicated across projects and forks, answered from the cache when resolved before, and otherwise
+# fetched concurrently; a range that cannot be fetched is left out.
+def resolve_commit_ranges(ranges, workers=None):
+    cache = get_commit_cache()
+    resolved, missing = {}, {}
+    for project_id, from_sha, to_sha in ranges:
+        key = (from_sha, to_sha)
+        if key in resolved or key in missing:
+            continue
+        if from_sha == to_sha:
+            resolved[key] = []  # Redeploying the same commit ships nothing new
             continue
-    raise ValueError(f"Date format for '{date_str}' is not supported")
+        cached = cache.get_range(from_sha, to_sha)
+        if cached is None:
+            missing[key] = project_id
+        else:
+            resolved[key] = cached
 
-# Analyze DORA metrics for a single project
-def analyze_dora_metrics(project_id, start_date, end_date):
-    deployments = fetch_deployments(project_id, start_date, end_date)
-    pipelines = fetch_pipelines(project_id, start_date, end_date)
-
-    deployment_times = [parse_datetime(d['created_at']) for d in deployments]
-
-    lead_times = []
-    change_failures = 0
-    restoration_times = []
-
-    for pipeline in pipelines:
-        if pipeline['status'] == 'success':
-            jobs = fetch_pipeline_jobs(project_id, pipeline['id'])
-            created_at = parse_datetime(pipeline['created_at'])
-            updated_at = parse_datetime(pipeline['updated_at'])
-            lead_times.append((updated_at - created_at).total_seconds() / 3600)  # Lead time in hours
-
-            for job in jobs:
-                if job['status'] == 'failed':
-                    change_failures += 1
-                if job['name'] == 'restore' and job['status'] == 'success':
-                    restoration_time = parse_datetime(job['finished_at']) - parse_datetime(job['started_at'])
-                    restoration_times.append(restoration_time.total_seconds() / 3600)  # Restoration time in hours
+    def fetch(item):
+        (from_sha, to_sha), project_id = item
+        try:
+            commits = fetch_commit_range(project_id, from_sha, to_sha)
+        except Exception as err:
+            print(f"Skipping commits {from_sha or ''}..{to_sha} of project {project_id}: {err}")
+            return None
+        cache.put_range(from_sha, to_sha, commits)
+        return [committed_at for _, committed_at in commits]
+
+    if not missing:
+        return resolved
+    with ThreadPoolExecutor(max_workers=workers or max_workers) as executor:
+        for key, timestamps in zip(missing, executor.map(fetch, missing.items())):
+            if timestamps is not None:
+                resolved[key] = timestamps
+    return resolved
+
+# Raised when a GraphQL query comes back with errors and no data
+class GitLabGraphQLError(Exception):
+    pass
+
+# Numeric id from a GraphQL global id such as gid://gitlab/Ci::Pipeline/42
+def gid_to_id(gid):
+    return int(gid.rsplit('/', 1)[1])
+
+# GraphQL arguments for a connection page of first nodes, continuing after cursor when given
+def connection_args(first, cursor=None, **args):
+    args = {'first': first, **args}
+    if cursor:
+        args['after'] = json.dumps(cursor)
+    return ', '.join(f'{name}: {value}' for name, value in args.items())
+
+page_info = 'pageInfo { hasNextPage endCursor }'
+
+# Selection for one step of a project's traversal, with first nodes per page. Each step reads a single
+# connection, since GitLab counts a nested connection's fields once per node of every enclosing page.
+def graphql_selection(task, start_date, end_date, first):
+    kind, cursor = task['kind'], task.get('cursor')
+    if kind == 'pipelines':
+        filters = {'ref': json.dumps(pipeline_ref)} if pipeline_ref else {}
+        args = connection_args(first, cursor, updatedAfter=json.dumps(start_date), updatedBefore=json.dumps(end_date), **filters)
+        return f'pipelines({args}) {{ {page_info} nodes {{ id status createdAt updatedAt }} }}'
+    if kind == 'jobs':
+        # The project's jobs newest first, like iter_project_jobs, rather than a walk per pipeline
+        args = connection_args(first, cursor, statuses='[FAILED, SUCCESS]')
+        return f'jobs({args}) {{ {page_info} nodes {{ id name status createdAt startedAt finishedAt pipeline {{ id }} }} }}'
+    if kind == 'environments':
+        return f'environments({connection_args(first, cursor)}) {{ {page_info} nodes {{ name }} }}'
+    order = 'finishedAt' if task['walk'] == 'finished' else 'createdAt'
+    args = connection_args(first, cursor, statuses=f"[{', '.join(task['statuses'])}]", orderBy=f'{{{order}: DESC}}')
+    deployments = f'deployments({args}) {{ {page_info} nodes {{ id status sha createdAt updatedAt finishedAt }} }}'
+    return f'environment(name: {json.dumps(task["environment"])}) {{ {deployments} }}'
+
+# GraphQL can't order deployments by updatedAt, the field the REST listing filters and stops on. Finished
+# deployments are walked by finishedAt instead (GitLab sorts on it only for finished statuses), which is
+# when they were last updated; the others, few at any time, are walked whole by createdAt.
+deployment_walks = {'finished': ['SUCCESS', 'FAILED', 'CANCELED'], 'other': ['CREATED', 'RUNNING', 'BLOCKED', 'SKIPPED']}
+
+# Steps walking an environment's deployments, one per walk that can hold deployment_status
+def deployment_tasks(project_id, environment):
+    tasks = []
+    for walk, statuses in deployment_walks.items():
+        if deployment_status:
+            statuses = [status for status in statuses if status == deployment_status.upper()]
+        if statuses:
+            tasks.append({'project_id': project_id, 'kind': 'deployments', 'environment': environment, 'walk': walk, 'statuses': statuses})
+    return tasks
+
+# Estimated complexity of a query or field, scored the way GitLab does: each field costs 1, and a field's
+# selections count once for every node its first: argument allows
+def graphql_complexity(query):
+    totals, first = [[0, 1]], 1
+    for token in re.finditer(r'\((?:[^()"]|"(?:[^"\\]|\\.)*")*\)|[{}]|\w+:|\w+', query):
+        text = token.group()
+        if text.startswith('('):
+            match = re.search(r'\bfirst: (\d+)', text)
+            first = int(match.group(1)) if match else 1
+        elif text == '{':
+            totals.append([0, first])
+            first = 1
+        elif text == '}':
+            cost, multiplier = totals.pop()
+            totals[-1][0] += cost * multiplier
+        elif not text.endswith(':'):
+            totals[-1][0] += 1
+            first = 1
+    return totals[0][0]
+
+# A step as a top-level field selecting its project. projects(ids:) is itself a connection, so first: 1
+# keeps it from being scored as a full page of projects.
+def graphql_field(task, start_date, end_date, first):
+    selection = graphql_selection(task, start_date, end_date, first)
+    return f'projects(ids: ["gid://gitlab/Project/{task["project_id"]}"], first: 1) {{ nodes {{ {selection} }} }}'
+
+# A step's field and estimated complexity, with the largest page (up to graphql_page_size) that keeps a
+# query holding just this step within graphql_max_complexity
+def graphql_step(task, start_date, end_date):
+    one, two = (graphql_complexity(graphql_field(task, start_date, end_date, first)) for first in (1, 2))
+    per_node = two - one
+    first = min(graphql_page_size, (graphql_max_complexity - 1 - one) // per_node + 1) if per_node else graphql_page_size
+    field = graphql_field(task, start_date, end_date, max(first, 1))
+    return task, field, graphql_complexity(field)
+
+# Pack steps into queries of at most graphql_batch_size steps and graphql_max_complexity in total
+def graphql_batches(steps):
+    batches, batch, complexity = [], [], 1
+    for step in steps:
+        if batch and (len(batch) == graphql_batch_size or complexity + step[2] > graphql_max_complexity):
+            batches.append(batch)
+            batch, complexity = [], 1
+        batch.append(step)
+        complexity += step[2]
+    if batch:
+        batches.append(batch)
+    return batches
+
+# One query covering a batch of steps, each under its own alias
+def graphql_query(steps):
+    return 'query { ' + ' '.join(f't{i}: {field}' for i, (_, field, _) in enumerate(steps)) + ' }'
+
+def run_graphql(query):
+    url = graphql_url or base_url.replace('/api/v4', '/api/graphql')
+    payload = get_client().post(url, {'query': query})
+    if payload.get('errors') and not payload.get('data'):
+        raise GitLabGraphQLError('; '.join(error.get('message', '') for error in payload['errors']))
+    return payload['data']
+
+# Collect a page of the project's jobs down to created_after, returning the follow-up step if older jobs remain
+def graphql_collect_jobs(task, connection, records):
+    nodes = connection['nodes']
+    created_after = task['created_after']
+    for node in nodes:
+        if parse_datetime(node['createdAt']) >= created_after:
+            records['jobs'].append(Job(
+                gid_to_id(node['id']), gid_to_id(node['pipeline']['id']), sys.intern(node['name']), sys.intern(node['status'].lower()),
+                node['createdAt'], node['startedAt'], node['finishedAt']
+            ))
+    if connection['pageInfo']['hasNextPage'] and nodes and parse_datetime(nodes[-1]['createdAt']) >= created_after:
+        return [{**task, 'cursor': connection['pageInfo']['endCursor']}]
+    return []
+
+# Collect a page of an environment's deployments, keeping those updated within the window as the REST
+# listing's updated_after/updated_before would. The finished walk stops once deployments finished before it.
+def graphql_collect_deployments(task, found, records, start, end):
+    # An environment named by deployment_environment that the project doesn't have holds no deployments
+    if found is None:
+        return []
+    connection = found['deployments']
+    nodes = connection['nodes']
+    environment = task['environment']
+    records['deployments'].extend(
+        Deployment(
+            gid_to_id(node['id']), node['createdAt'], node['updatedAt'], sys.intern(node['status'].lower()), sys.intern(environment), node['sha']
+        )
+        for node in nodes if start < parse_datetime(node['updatedAt']) < end
+    )
+    if not connection['pageInfo']['hasNextPage'] or task['walk'] == 'finished' and nodes and parse_datetime(nodes[-1]['finishedAt']) < start:
+        return []
+    return [{**task, 'cursor': connection['pageInfo']['endCursor']}]
+
+# Turn one step's result into records, returning the steps that continue the traversal
+def graphql_collect(task, project, records, start, end):
+    project_id, kind = task['project_id'], task['kind']
+    if kind == 'jobs':
+        return graphql_collect_jobs(task, project['jobs'], records)
+    if kind == 'deployments':
+        return graphql_collect_deployments(task, project['environment'], records, start, end)
+
+    connection = project[kind]
+    follow_ups = []
+    if kind == 'pipelines':
+        records['pipelines'].extend(
+            Pipeline(gid_to_id(node['id']), sys.intern(node['status'].lower()), node['createdAt'], node['updatedAt'])
+            for node in connection['nodes']
+        )
+    else:
+        follow_ups += [step for node in connection['nodes'] for step in deployment_tasks(project_id, node['name'])]
+
+    if connection['pageInfo']['hasNextPage']:
+        follow_ups.append({'project_id': project_id, 'kind': kind, 'cursor': connection['pageInfo']['endCursor']})
+    elif kind == 'pipelines':
+        # With every pipeline in hand, list the jobs back to the oldest successful one, as fetch_jobs_for_pipelines does
+        successful = [p for p in records['pipelines'] if p.status == 'success']
+        if successful and incident_source == 'jobs':
+            oldest = min(parse_datetime(p.created_at) for p in successful)
+            follow_ups.append({'project_id': project_id, 'kind': 'jobs', 'created_after': oldest})
+    return follow_ups
+
+# Run a batch of steps, returning None instead of raising so one bad batch doesn't stop the run
+def try_run_graphql(steps):
+    try:
+        return run_graphql(graphql_query(steps))
+    except Exception as err:
+        print(f"Skipping projects {sorted({task['project_id'] for task, _, _ in steps})}: {err}")
+        return None
+
+# GraphQL alternative to fetch_project_records: walks many projects' pipelines, jobs and environments'
+# deployments together, packing several projects' next pages into each query
+def fetch_records_graphql(project_ids, start_date, end_date, workers=None):
+    start, end = parse_datetime(start_date), parse_datetime(end_date)
+    records_by_project = {project_id: {kind: [] for kind in record_types} for project_id in project_ids}
+    failed = set()
+    tasks = [{'project_id': project_id, 'kind': 'pipelines'} for project_id in project_ids]
+    # With a single environment there is nothing to discover; its deployments are walked straight away
+    for project_id in project_ids:
+        if deployment_environment:
+            tasks += deployment_tasks(project_id, deployment_environment)
+        else:
+            tasks.append({'project_id': project_id, 'kind': 'environments'})
+
+    # Each round sends every pending step, packed by graphql_batches, and queues the continuations
+    while tasks:
+        batches = graphql_batches(graphql_step(task, start_date, end_date) for task in tasks)
+        tasks = []
+        with ThreadPoolExecutor(max_workers=workers or max_workers) as executor:
+            for batch, data in zip(batches, executor.map(try_run_graphql, batches)):
+                for i, (task, _, _) in enumerate(batch):
+                    project_id = task['project_id']
+                    if data is None or project_id in failed:
+                        failed.add(project_id)
+                        continue
+                    nodes = (data.get(f't{i}') or {}).get('nodes')
+                    if not nodes:
+                        print(f"Skipping project {project_id}: not found")
+                        failed.add(project_id)
+                        continue
+                    tasks += graphql_collect(task, nodes[0], records_by_project[project_id], start, end)
+
+    for project_id in failed:
+        del records_by_project[project_id]
+    return records_by_project
+
+# Columns loaded from each kind of record into the columnar frames
+frame_columns = {kind: ['project_id'] + list(record_type.__slots__) for kind, record_type in record_types.items()}
+timestamp_columns = ('created_at', 'updated_at', 'started_at', 'finished_at')
+
+# Load every project's records into one DataFrame per kind, parsing timestamps in bulk
+def build_frames(records_by_project):
+    frames = {}
+    for kind, columns in frame_columns.items():
+        rows = [(project_id,) + record.values() for project_id, records in records_by_project.items() for record in records[kind]]
+        frame = pd.DataFrame(rows, columns=columns)
+        for column in columns:
+            if column in timestamp_columns:
+                frame[column] = pd.to_datetime(frame[column], utc=True, format='ISO8601')
+        frames[kind] = frame
+    return frames
+
+# Columnar store of slimmed raw records, laid out as <root>/<kind>/project_id=<id>/month=<YYYY-MM>/*.parquet.
+# Records are partitioned on the month they were created, which never changes, so each id lives in one partition.
+class RawStore:
+    def __init__(self, root):
+        if ds is None:
+            raise ImportError("The raw-data store needs pyarrow: pip install pyarrow")
+        self.root = root
+        # Scans discover every file of a kind, so they must not run while another thread rewrites a partition
+        self.lock = threading.Lock()
+        self.partitioning = ds.partitioning(pa.schema([('project_id', pa.int64()), ('month', pa.string())]), flavor='hive')
+        self.project_partitioning = ds.partitioning(pa.schema([('group_id', pa.string())]), flavor='hive')
+
+    def read(self, kind, filter=None, columns=None):
+        columns = columns or frame_columns[kind]
+        path = os.path.join(self.root, kind)
+        if not os.path.isdir(path):
+            return build_frames({})[kind].reindex(columns=columns)
+        with self.lock:
+            dataset = ds.dataset(path, format='parquet', partitioning=self.partitioning)
+            # Files written before a record field was added lack its column, which reads as None
+            present = [column for column in columns if column in dataset.schema.names]
+            return dataset.to_table(columns=present, filter=filter).to_pandas().reindex(columns=columns)
+
+    # Merge a project's records into their month partitions; re-ingested ids replace the stored copy
+    def write(self, project_id, records):
+        for kind, frame in build_frames({project_id: records}).items():
+            if frame.empty:
+                continue
+            frame = frame.assign(month=frame['created_at'].dt.strftime('%Y-%m'))
+            months = sorted(frame['month'].unique())
+            existing = self.read(kind, (ds.field('project_id') == project_id) & ds.field('month').isin(months), frame_columns[kind] + ['month'])
+            merged = pd.concat([existing, frame]).drop_duplicates(['project_id', 'id'], keep='last')
+            with self.lock:
+                ds.write_dataset(
+                    pa.Table.from_pandas(merged, preserve_index=False), os.path.join(self.root, kind), format='parquet',
+                    partitioning=self.partitioning, existing_data_behavior='delete_matching'
+                )
+
+    # Replace the stored project list of a group
+    def write_projects(self, group_id, projects):
+        frame = pd.DataFrame(projects, columns=list(project_fields)).assign(group_id=str(group_id))
+        with self.lock:
+            ds.write_dataset(
+                pa.Table.from_pandas(frame, preserve_index=False), os.path.join(self.root, 'projects'), format='parquet',
+                partitioning=self.project_partitioning, existing_data_behavior='delete_matching'
+            )
+
+    def read_project_ids(self, group_id):
+        path = os.path.join(self.root, 'projects')
+        if not os.path.isdir(path):
+            return []
+        dataset = ds.dataset(path, format='parquet', partitioning=self.project_partitioning)
+        return dataset.to_table(columns=['id'], filter=ds.field('group_id') == str(group_id)).column('id').to_pylist()
+
+    # Frames for compute_daily_totals, reading only the partitions, rows and columns the window needs
+    def load_frames(self, project_ids, start_date, end_date):
+        start, end = pd.to_datetime(start_date, utc=True), pd.to_datetime(end_date, utc=True)
+        projects = ds.field('project_id').isin(list(project_ids))
+        # Nothing created after the window can count towards it
+        months = ds.field('month') <= end.strftime('%Y-%m')
+
+        pipelines = self.read('pipelines', projects & months & (ds.field('updated_at') >= start) & (ds.field('updated_at') <= end))
+        # Deployments updated inside the window, like the REST listing; compute_daily_totals counts the frequency
+        # from those also created in it, and incidents and commit lead times from all of them
+        deployments = self.read('deployments', projects & months & (ds.field('updated_at') >= start) & (ds.field('updated_at') <= end))
+        successful = pipelines.loc[pipelines['status'] == 'success', 'id'].tolist()
+        if incident_source == 'jobs':
+            jobs = self.read('jobs', projects & months & ds.field('pipeline_id').isin(successful))
+        else:
+            jobs = build_frames({})['jobs']
+        return {'pipelines': pipelines, 'jobs': jobs, 'deployments': deployments}
+
+# Per-project per-day sums and counts that every metric and rollup is derived from
+totals_columns = ['deployments', 'pipelines', 'lead_time_sum', 'lead_time_count', 'change_failures', 'restore_sum', 'restore_count']
+# Quantile sketches of the lead times and restore times, kept alongside the totals (None on days without any)
+sketch_columns = ['lead_time_sketch', 'restore_sketch']
+# Columns counted from jobs when incident_source is 'jobs'
+job_columns = ['change_failures', 'restore_sum', 'restore_count', 'restore_sketch']
+
+def sketch_gamma():
+    return (1 + sketch_relative_accuracy) / (1 - sketch_relative_accuracy)
+
+# Bucket of each duration (hours): bucket k holds values in (gamma^(k-1), gamma^k]; works on scalars and Series
+def sketch_keys(hours):
+    return np.ceil(np.log(np.maximum(hours, sketch_min_hours)) / np.log(sketch_gamma()))
+
+# Mergeable quantile sketch (DDSketch-style): counts per logarithmic bucket, so merging two sketches is
+# adding their counts and percentiles of any merge stay within the relative accuracy, with no raw values kept
+class QuantileSketch:
+    __slots__ = ('bins', 'count')
+
+    def __init__(self, bins=None):
+        self.bins = dict(bins or {})
+        self.count = sum(self.bins.values())
+
+    def add(self, hours):
+        key = int(sketch_keys(hours))
+        self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += other.count
+        return self
+
+    # New sketch combining sketches, skipping the None (or NaN) of days without values
+    @classmethod
+    def merged(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            if isinstance(sketch, cls):
+                result.merge(sketch)
+        return result
+
+    # Value at quantile q (0..1), or 0 when empty like the means
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                break
+        gamma = sketch_gamma()
+        return 2 * gamma ** key / (gamma + 1)
+
+    def to_dict(self):
+        return {str(key): count for key, count in self.bins.items()}
+
+    @classmethod
+    def from_dict(cls, bins):
+        return cls({int(key): count for key, count in bins.items()})
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.bins == other.bins
+
+    def __repr__(self):
+        return f'QuantileSketch(count={self.count}, p50={self.quantile(0.5):.3f})'
+
+# Hours between two timestamp columns
+def hours_between(start, end):
+    return (end - start).dt.total_seconds() / 3600
+
+# Calendar days (UTC) covered by a window, as naive midnights
+def window_days(start_date, end_date):
+    start, end = parse_datetime(start_date), parse_datetime(end_date)
+    return pd.date_range(start.replace(hour=0, minute=0, second=0, microsecond=0), end, freq='D')
+
+# Group keys bucketing each row of frame by project and by the UTC day of its time column
+def day_keys(frame, column):
+    return [frame['project_id'], frame[column].dt.tz_convert(None).dt.floor('D').rename('date')]
+
+# Sketch of the durations (hours) of each project and day of the grid, bucketed in one group-by
+def daily_sketches(hours, keys, grid):
+    counts = hours.groupby(keys + [sketch_keys(hours).astype('int64').rename('bin')]).size()
+    bins_by_day = defaultdict(dict)
+    for (project_id, day, key), count in counts.items():
+        bins_by_day[project_id, day][int(key)] = int(count)
+    return [QuantileSketch(bins_by_day[cell]) if cell in bins_by_day else None for cell in grid]
+
+# Incidents of each project and environment, from one sweep over their deployments' status transitions:
+# finished deployments are sorted once, an incident opens at a failure while the environment is healthy, stays
+# open through further failures (overlapping attempts are one incident) and closes at the next successful
+# deployment. Environments are swept independently, so their incidents may overlap; open incidents are left out.
+def deployment_incidents(deployments):
+    finished = deployments[deployments['status'].isin(['success', 'failed'])]
+    finished = finished.assign(environment=finished['environment'].fillna('')).sort_values(['project_id', 'environment', 'updated_at', 'id'])
+    keys = [finished['project_id'], finished['environment']]
+    failed = finished['status'] == 'failed'
+    after_failure = failed.groupby(keys).shift(fill_value=False).astype(bool)
+    opened_at = finished['updated_at'].where(failed & ~after_failure).groupby(keys).ffill()
+    recoveries = finished[~failed & after_failure]
+    return pd.DataFrame({'project_id': recoveries['project_id'], 'failed_at': opened_at[recoveries.index], 'recovered_at': recoveries['updated_at']})
+
+# Commit lead times of successful deployments: every commit each one shipped since the previous successful
+# deployment of its environment, as rows of project_id, deployed_at (the deployment's updated_at) and committed_at
+def commit_lead_times(deployments):
+    shipped = deployments[(deployments['status'] == 'success') & deployments['sha'].notna()]
+    shipped = shipped.assign(environment=shipped['environment'].fillna('')).sort_values(['project_id', 'environment', 'updated_at', 'id'])
+    previous = shipped.groupby([shipped['project_id'], shipped['environment']])['sha'].shift().fillna('')
+    ranges = list(zip(shipped['project_id'], previous, shipped['sha']))
+    with run_metrics.stage('commits'):
+        resolved = resolve_commit_ranges(ranges)
+    rows = [
+        (project_id, deployed_at, committed_at)
+        for (project_id, from_sha, to_sha), deployed_at in zip(ranges, shipped['updated_at'])
+        for committed_at in resolved.get((from_sha, to_sha), ())
+    ]
+    changes = pd.DataFrame(rows, columns=['project_id', 'deployed_at', 'committed_at'])
+    changes['deployed_at'] = pd.to_datetime(changes['deployed_at'], utc=True)
+    changes['committed_at'] = pd.to_datetime(changes['committed_at'], utc=True, format='ISO8601')
+    return changes
+
+# Assign every deployment, pipeline and job to its day and total them per project per day in one pass
+def compute_daily_totals(frames, project_ids, start_date, end_date):
+    start, end = pd.to_datetime(start_date, utc=True), pd.to_datetime(end_date, utc=True)
+    pipelines, jobs, deployments = frames['pipelines'], frames['jobs'], frames['deployments']
+
+    # Records may come from a wider window (e.g. the incremental store), so keep only this one
+    pipelines = pipelines[pipelines['updated_at'].between(start, end)]
+    successful = pipelines[pipelines['status'] == 'success']
+    # Deployments that finished inside the window, which is what the deployments API returns for it
+    finished = deployments[deployments['updated_at'].between(start, end)]
+
+    if lead_time_source == 'pipelines':
+        lead_times = hours_between(successful['created_at'], successful['updated_at'])
+        lead_time_on = day_keys(successful, 'updated_at')
+    else:
+        # Each commit counts on the day the deployment that shipped it finished
+        changes = commit_lead_times(finished)
+        lead_times = hours_between(changes['committed_at'], changes['deployed_at'])
+        lead_time_on = day_keys(changes, 'deployed_at')
+
+    if incident_source == 'jobs':
+        # Latest attempt of each job in a successful pipeline, like the pipeline jobs endpoint returns
+        jobs = jobs.sort_values('id').drop_duplicates(['project_id', 'pipeline_id', 'name'], keep='last')
+        parents = successful[['project_id', 'id', 'updated_at']].rename(columns={'id': 'pipeline_id', 'updated_at': 'pipeline_updated_at'})
+        jobs = jobs.merge(parents, on=['project_id', 'pipeline_id'])
+        failed = jobs[jobs['status'] == 'failed']
+        failed_on = 'pipeline_updated_at'
+        restores = jobs[(jobs['name'] == 'restore') & (jobs['status'] == 'success')].copy()
+        restores['finished_at'] = restores['finished_at'].clip(start, end)
+        restore_times = hours_between(restores['started_at'], restores['finished_at'])
+        restored_on = day_keys(restores, 'finished_at')
+    else:
+        # Failed deployments count on the day they were created, like all deployments. The sweep takes every
+        # deployment that finished inside the window, and an incident counts on the day it was recovered.
+        failed = deployments[(deployments['status'] == 'failed') & deployments['created_at'].between(start, end)]
+        failed_on = 'created_at'
+        incidents = deployment_incidents(finished)
+        restore_times = hours_between(incidents['failed_at'], incidents['recovered_at'])
+        restored_on = day_keys(incidents, 'recovered_at')
+    deployments = deployments[deployments['created_at'].between(start, end)]
+
+    grid = pd.MultiIndex.from_product([project_ids, window_days(start_date, end_date)], names=['project_id', 'date'])
+    totals = pd.DataFrame(index=grid)
+    # Pipelines and the failures inside them count on the day the pipeline finished (its updated_at)
+    totals['deployments'] = deployments.groupby(day_keys(deployments, 'created_at')).size()
+    totals['pipelines'] = pipelines.groupby(day_keys(pipelines, 'updated_at')).size()
+    totals['lead_time_sum'] = lead_times.groupby(lead_time_on).sum()
+    totals['lead_time_count'] = lead_times.groupby(lead_time_on).size()
+    totals['change_failures'] = failed.groupby(day_keys(failed, failed_on)).size()
+    # Restores count on the day they finished (the recovering deployment's, for incidents)
+    totals['restore_sum'] = restore_times.groupby(restored_on).sum()
+    totals['restore_count'] = restore_times.groupby(restored_on).size()
+    totals = totals.fillna(0)
+
+    totals['lead_time_sketch'] = daily_sketches(lead_times, lead_time_on, grid)
+    totals['restore_sketch'] = daily_sketches(restore_times, restored_on, grid)
+    return totals.reset_index()
+
+# Sum daily totals into periods ('W', 'M', ...) per project, or over the whole window when freq is None, and
+# merge their sketches. by_project=False rolls all the projects up together (a team or the whole group).
+def rollup_totals(daily_totals, freq=None, by_project=True):
+    keys = ['project_id'] if by_project else []
+    if freq is not None:
+        keys.append(daily_totals['date'].dt.to_period(freq))
+    elif not by_project:
+        keys.append(pd.Series('window', index=daily_totals.index, name='period'))
+    grouped = daily_totals.groupby(keys, sort=False)
+    rolled = grouped[totals_columns].sum()
+    for column in sketch_columns:
+        if column in daily_totals:
+            rolled[column] = grouped[column].agg(QuantileSketch.merged)
+    # Days in each period; projects side by side share their days
+    rolled['days'] = grouped.size() if by_project else grouped['date'].nunique()
+    return rolled.reset_index()
+
+# Add up daily totals of the same projects and days, merging their sketches; frames may carry only some
+# of the columns (those missing count as zero)
+def sum_daily_totals(frames):
+    grouped = pd.concat(frames, ignore_index=True).groupby(['project_id', 'date'], sort=False)
+    totals = grouped[totals_columns].sum()
+    for column in sketch_columns:
+        totals[column] = grouped[column].agg(QuantileSketch.merged).map(lambda sketch: sketch if sketch.count else None)
+    return totals.reset_index()
+
+# Turn sums and counts into DORA metrics; ratios of totals, never means of means
+def totals_to_metrics(totals):
+    metrics = totals.drop(columns=totals_columns + sketch_columns + ['days'], errors='ignore')
+    days = totals['days'] if 'days' in totals else 1
 
     # Deployment frequency as deployments per day
-    total_days = (parse_datetime(end_date) - parse_datetime(start_date)).days + 1
-    deployment_frequency = len(deployment_times) / total_days if total_days > 0 else 0
-    
+    metrics['deployment_frequency'] = totals['deployments'] / days
+
     # Average lead time for changes in hours
-    lead_time_for_changes = sum(lead_times) / len(lead_times) if lead_times else 0
-    
-    # Change failure rate as percentage
-    change_failure_rate = (change_failures / len(pipelines)) * 100 if pipelines else 0
-    
+    metrics['lead_time_for_changes'] = (totals['lead_time_sum'] / totals['lead_time_count']).fillna(0)
+
+    # Change failure rate as percentage of all pipelines, or of all deployments when they are the incident source
+    changes = totals['pipelines'] if incident_source == 'jobs' else totals['deployments']
+    metrics['change_failure_rate'] = (totals['change_failures'] / changes * 100).fillna(0)
+
     # Mean time to restore in hours
-    mttr = sum(restoration_times) / len(restoration_times) if restoration_times else 0
-
-    return {
-        'deployment_frequency': deployment_frequency,
-        'lead_time_for_changes': lead_time_for_changes,
-        'change_failure_rate': change_failure_rate,
-        'mean_time_to_restore': mttr
-    }
-
-# Function to analyze multiple projects and aggregate metrics
-def analyze_multiple_projects(project_ids, start_date, end_date):
-    metrics = {
-        'project_id': [],
-        'date': [],
-        'deployment_frequency': [],
-        'lead_time_for_changes': [],
-        'change_failure_rate': [],
-        'mean_time_to_restore': []
-    }
+    metrics['mean_time_to_restore'] = (totals['restore_sum'] / totals['restore_count']).fillna(0)
 
-    for project_id in project_ids:
-        dora_metrics = analyze_dora_metrics(project_id, start_date, end_date)
-        metrics['project_id'].append(project_id)
-        metrics['date'].append(end_date)  # Assuming end_date as the date for reporting purposes
-        metrics['deployment_frequency'].append(dora_metrics['deployment_frequency'])
-        metrics['lead_time_for_changes'].append(dora_metrics['lead_time_for_changes'])
-        metrics['change_failure_rate'].append(dora_metrics['change_failure_rate'])
-        metrics['mean_time_to_restore'].append(dora_metrics['mean_time_to_restore'])
-
-    metrics_df = pd.DataFrame(metrics)
+    # Lead time and time to restore percentiles in hours, e.g. lead_time_p50
+    for name, column in (('lead_time', 'lead_time_sketch'), ('time_to_restore', 'restore_sketch')):
+        if column in totals:
+            for q in reported_quantiles:
+                metrics[f'{name}_p{q * 100:g}'] = totals[column].map(lambda sketch: sketch.quantile(q) if sketch is not None else 0.0)
+
+    return metrics
+
+# Metrics of a team or a whole group: the projects' totals summed and their sketches merged,
+# per period when freq is given, otherwise over the whole window
+def group_metrics(daily_totals, freq=None, project_ids=None):
+    if project_ids is not None:
+        daily_totals = daily_totals[daily_totals['project_id'].isin(project_ids)]
+    return totals_to_metrics(rollup_totals(daily_totals, freq, by_project=False))
+
+# Compute window DORA metrics for all projects at once with vectorized group-bys
+def compute_metrics_frame(frames, project_ids, start_date, end_date):
+    return totals_to_metrics(rollup_totals(compute_daily_totals(frames, project_ids, start_date, end_date)))
+
+# Compute DORA metrics from a single project's pipelines, jobs and deployments
+def compute_dora_metrics(records, start_date, end_date):
+    metrics_df = compute_metrics_frame(build_frames({0: records}), [0], start_date, end_date)
+    return metrics_df.drop(columns='project_id').iloc[0].to_dict()
+
+# Analyze DORA metrics for a single project
+def analyze_dora_metrics(project_id, start_date, end_date, state=None):
+    records = load_project_records(project_id, start_date, end_date, state)
+    with run_metrics.stage('compute'):
+        return compute_dora_metrics(records, start_date, end_date)
+
+# Total a single project's records per day while streaming them. Pipelines and jobs go through
+# compute_daily_totals a batch at a time and the batches' totals are summed, so the full pipeline and job
+# listings are never held at once. Memory still grows with history, more slowly: the successful pipelines
+# (the jobs' parents), the keys of the jobs seen and the deployments, which incidents and commit lead times
+# need as whole timelines, are kept until the end.
+def stream_daily_totals(project_id, start_date, end_date):
+    buffered = per_page * page_workers
+
+    def batch_totals(pipelines=(), jobs=(), deployments=()):
+        records = {'pipelines': list(pipelines), 'jobs': list(jobs), 'deployments': list(deployments)}
+        return compute_daily_totals(build_frames({project_id: records}), [project_id], start_date, end_date)
+
+    # Deployments are totaled with the first batch of pipelines, saving a compute_daily_totals call
+    deployments = list(prefetch(iter_deployments(project_id, start_date, end_date), buffered))
+    totals = None
+    successful = {}
+    for pipelines in batched(prefetch(iter_pipelines(project_id, start_date, end_date), buffered), stream_batch_size):
+        if totals is None:
+            totals = batch_totals(pipelines=pipelines, deployments=deployments)
+        else:
+            totals = sum_daily_totals([totals, batch_totals(pipelines=pipelines)])
+        successful.update((pipeline.id, pipeline) for pipeline in pipelines if pipeline.status == 'success')
+    if totals is None:
+        totals = batch_totals(deployments=deployments)
+
+    if successful and incident_source == 'jobs':
+        oldest = min(parse_datetime(pipeline.created_at) for pipeline in successful.values())
+        seen = set()
+        jobs = iter_project_jobs(project_id, oldest, scope=['failed', 'success'])
+        for batch in batched(prefetch(jobs, buffered), stream_batch_size):
+            # Jobs come newest first, so a job already seen in an earlier batch is an older attempt
+            batch = [job for job in batch if job.pipeline_id in successful and (job.pipeline_id, job.name) not in seen]
+            if not batch:
+                continue
+            seen.update((job.pipeline_id, job.name) for job in batch)
+            # The parents were counted with their own batch; only the job columns come from this one,
+            # totaled with just the pipelines its jobs belong to
+            parents = [successful[pipeline_id] for pipeline_id in {job.pipeline_id for job in batch}]
+            counted = batch_totals(pipelines=parents, jobs=batch)
+            totals = sum_daily_totals([totals, counted[['project_id', 'date'] + job_columns]])
+
+    return totals
+
+# Fetch a project's records; with a SyncState only changes since the last run are fetched,
+# and with a RawStore the records are also ingested into it
+def load_project_records(project_id, start_date, end_date, state=None, store=None):
+    if state is not None:
+        records = sync_project_records(state, project_id, start_date, end_date)
+    else:
+        records = fetch_project_records(project_id, start_date, end_date)
+    if store is not None:
+        store.write(project_id, records)
+    return records
+
+# Run func for one project, returning None instead of raising so one bad project doesn't stop the run.
+# The call is profiled as a stage named after func when profile_dir or trace_memory is set.
+def try_project(func, project_id, *args):
+    try:
+        with profiled(func.__name__, project_id):
+            return func(project_id, *args)
+    except Exception as err:
+        print(f"Skipping project {project_id}: {err}")
+        return None
+
+# Fetch every project's records once and total them per project per day
+# backend='graphql' fetches through fetch_records_graphql instead of the REST fetch_* functions
+def collect_daily_totals(project_ids, start_date, end_date, workers=None, state=None, stream=False, store=None, backend='rest'):
+    if stream and (state is not None or store is not None):
+        raise ValueError("Streaming analysis keeps no records, so it cannot be combined with incremental state or a raw store")
+    if backend == 'graphql':
+        if stream or state is not None:
+            raise ValueError("The GraphQL backend supports neither streaming nor incremental state")
+        with run_metrics.stage('fetch'):
+            records_by_project = fetch_records_graphql(project_ids, start_date, end_date, workers)
+        if store is not None:
+            with run_metrics.stage('store_write'):
+                for project_id, records in records_by_project.items():
+                    store.write(project_id, records)
+        return total_records(records_by_project, start_date, end_date)
+
+    # Fan the projects out over a bounded thread pool; map() keeps results in input order.
+    # Profiled projects must not overlap, or each one's stats would include the others'.
+    if profile_dir or trace_memory:
+        workers = 1
+    with run_metrics.stage('fetch'), ThreadPoolExecutor(max_workers=workers or max_workers) as executor:
+        if stream:
+            results = executor.map(lambda project_id: try_project(stream_daily_totals, project_id, start_date, end_date), project_ids)
+            frames = [totals for totals in results if totals is not None]
+        else:
+            results = executor.map(lambda project_id: try_project(load_project_records, project_id, start_date, end_date, state, store), project_ids)
+            records_by_project = {project_id: records for project_id, records in zip(project_ids, results) if records is not None}
+
+    if stream:
+        # With no project left, the empty totals still need their column types for the reports
+        return pd.concat(frames, ignore_index=True) if frames else total_records({}, start_date, end_date)
+    # Then bucket every project's records in one vectorized pass
+    return total_records(records_by_project, start_date, end_date)
+
+# Build the frames of fetched records and total them per project per day
+def total_records(records_by_project, start_date, end_date):
+    with run_metrics.stage('frames'):
+        frames = build_frames(records_by_project)
+    with run_metrics.stage('totals'):
+        return compute_daily_totals(frames, list(records_by_project), start_date, end_date)
+
+# Function to analyze multiple projects and aggregate metrics over the whole window
+def analyze_multiple_projects(project_ids, start_date, end_date, workers=None, state=None, stream=False, backend='rest'):
+    daily_totals = collect_daily_totals(project_ids, start_date, end_date, workers, state, stream, backend=backend)
+    metrics_df = totals_to_metrics(rollup_totals(daily_totals))
+    metrics_df.insert(1, 'date', end_date)  # Assuming end_date as the date for reporting purposes
     return metrics_df
 
-# Function to generate monthly and daily reports
-def generate_reports(group_id, start_date, end_date):
-    projects = fetch_group_projects(group_id)
-    project_ids = [project['id'] for project in projects]
+# Per-project metrics for each day, or each week/month etc. when freq is given, from daily totals
+def build_report(daily_totals, freq=None):
+    if freq is None:
+        return totals_to_metrics(daily_totals)
+    return totals_to_metrics(rollup_totals(daily_totals, freq))
 
-    # Daily report
-    daily_metrics_df = analyze_multiple_projects(project_ids, start_date, end_date)
-    daily_metrics_df['date'] = pd.to_datetime(daily_metrics_df['date'])
+# Function to generate monthly and daily reports from a single fetch of the window.
+# With a RawStore the fetched records are ingested into it; from_store=True computes from the store alone.
+def generate_reports(group_id, start_date, end_date, workers=None, incremental=False, skip_archived=False, stream=False, store=None, from_store=False, backend='rest'):
+    if from_store:
+        with run_metrics.stage('store_read'):
+            project_ids = store.read_project_ids(group_id)
+            frames = store.load_frames(project_ids, start_date, end_date)
+        with run_metrics.stage('totals'):
+            daily_totals = compute_daily_totals(frames, project_ids, start_date, end_date)
+    else:
+        with run_metrics.stage('discovery'):
+            projects = list(iter_group_projects(group_id, skip_archived))
+        if store is not None:
+            store.write_projects(group_id, projects)
+        project_ids = [project['id'] for project in projects]
+        state = SyncState(state_path) if incremental else None
+
+        daily_totals = collect_daily_totals(project_ids, start_date, end_date, workers, state, stream, store, backend)
+        if state is not None:
+            state.close()
 
-    # Monthly report
-    monthly_metrics_df = daily_metrics_df.copy()
-    monthly_metrics_df['date'] = monthly_metrics_df['date'].dt.to_period('M')
-    monthly_metrics_df = monthly_metrics_df.groupby(['project_id', 'date']).mean().reset_index()
+    with run_metrics.stage('report'):
+        # Daily report: one row per project per day
+        daily_metrics_df = build_report(daily_totals)
+
+        # Monthly report, rolled up from the daily sums and counts
+        monthly_metrics_df = build_report(daily_totals, 'M')
 
     return daily_metrics_df, monthly_metrics_df
 
-# Example usage
-group_id = 'YOUR_GROUP_ID_HERE'  # Replace with your GitLab group ID
-start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%SZ')  # Adjust date range as needed
-end_date = datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
+# Shard a project belongs to, out of shards; stable across processes, machines and Python versions
+def shard_of(project_id, shards):
+    digest = hashlib.sha1(str(project_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+# Total one shard's share of a group's projects and save them as a partial aggregate. Partials hold
+# per-project per-day sums, counts and sketches only, so merging them reproduces the unsharded reports.
+def run_shard(group_id, start_date, end_date, shard, shards, path, workers=None, skip_archived=False, stream=False, backend='rest'):
+    with run_metrics.stage('discovery'):
+        projects = list(iter_group_projects(group_id, skip_archived))
+    project_ids = [project['id'] for project in projects if shard_of(project['id'], shards) == shard]
+    daily_totals = collect_daily_totals(project_ids, start_date, end_date, workers, stream=stream, backend=backend)
+    write_partial(path, {
+        'group_id': group_id, 'start_date': start_date, 'end_date': end_date, 'shard': shard, 'shards': shards,
+        'project_ids': project_ids, 'daily_totals': daily_totals
+    })
 
-daily_metrics_df, monthly_metrics_df = generate_reports(group_id, start_date, end_date)
+# Partials are JSON, with the daily totals stored column by column
+def write_partial(path, partial):
+    totals = partial['daily_totals']
+    columns = {column: totals[column].tolist() for column in totals_columns}
+    columns['project_id'] = totals['project_id'].tolist()
+    columns['date'] = totals['date'].dt.strftime('%Y-%m-%d').tolist()
+    for column in sketch_columns:
+        columns[column] = [sketch.to_dict() if sketch is not None else None for sketch in totals[column]]
+    with open(path, 'w') as f:
+        json.dump({**partial, 'daily_totals': columns}, f)
+
+def read_partial(path):
+    with open(path) as f:
+        partial = json.load(f)
+    totals = pd.DataFrame(partial['daily_totals'], columns=['project_id', 'date'] + totals_columns + sketch_columns)
+    totals['date'] = pd.to_datetime(totals['date'])
+    for column in sketch_columns:
+        totals[column] = [QuantileSketch.from_dict(bins) if isinstance(bins, dict) else None for bins in totals[column]]
+    partial['daily_totals'] = totals
+    return partial
+
+# Combine the partials of every shard of one run into the daily and monthly reports
+def merge_partials(paths):
+    partials = [read_partial(path) for path in paths]
+    if not partials:
+        raise ValueError("No partial aggregates to merge")
+    run = {key: partials[0][key] for key in ('group_id', 'start_date', 'end_date', 'shards')}
+    for partial in partials:
+        if any(partial[key] != value for key, value in run.items()):
+            raise ValueError(f"Partial for shard {partial['shard']} belongs to a different run: {partial['group_id']}, {partial['start_date']}..{partial['end_date']}, {partial['shards']} shards")
+    shards = [partial['shard'] for partial in partials]
+    missing = sorted(set(range(run['shards'])) - set(shards))
+    if missing or len(shards) != len(set(shards)):
+        raise ValueError(f"Expected each of {run['shards']} shards exactly once; missing {missing}, got {sorted(shards)}")
+
+    daily_totals = pd.concat([partial['daily_totals'] for partial in partials], ignore_index=True)
+    daily_totals = daily_totals.sort_values(['project_id', 'date'], ignore_index=True)
+    return build_report(daily_totals), build_report(daily_totals, 'M')
+
+# Run every shard as a separate local process, then merge their partials
+def run_local_shards(args, shards, directory):
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f'shard-{shard}-of-{shards}.json') for shard in range(shards)]
+    command = [sys.executable, os.path.abspath(__file__), 'shard', '--shards', str(shards)] + common_arguments(args)
+    # The token goes through the environment so it doesn't show up in process listings
+    env = {**os.environ, 'GITLAB_TOKEN': access_token}
+    workers = [subprocess.Popen(command + ['--shard', str(shard), '--output', path], env=env) for shard, path in zip(range(shards), paths)]
+    failed = [shard for shard, worker in enumerate(workers) if worker.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards {failed} failed")
+    return merge_partials(paths)
+
+# Options shared by the report, shard and local commands, in the form the shard command accepts them
+def common_arguments(args):
+    options = ['--group', str(args.group), '--start', args.start, '--end', args.end, '--base-url', base_url, '--backend', args.backend]
+    if args.workers:
+        options += ['--workers', str(args.workers)]
+    if args.skip_archived:
+        options.append('--skip-archived')
+    if args.stream:
+        options.append('--stream')
+    for name in setting_names:
+        value = getattr(args, name, None)
+        if value is not None:
+            options += ['--' + name.replace('_', '-'), value]
+    return options
+
+# Module settings that can be given on the command line, under the same names with dashes
+setting_names = (
+    'cache_path', 'deployment_environment', 'deployment_status', 'pipeline_ref', 'incident_source', 'lead_time_source',
+    'commit_cache_path', 'state_path'
+)
+
+# Replace the module settings with the values of the command's options
+def apply_settings(args):
+    globals().update({name: getattr(args, name) for name in setting_names if hasattr(args, name)})
+
+# Webhook timestamps come as '2021-04-28 21:50:00 UTC', '2021-04-28 21:50:00 +0200' or ISO 8601;
+# records keep the API's ISO 'Z' form
+def webhook_time(value):
+    if not value:
+        return None
+    value = value.replace(' UTC', 'Z') if value.endswith(' UTC') else value
+    parsed = parse_datetime(re.sub(r' ([+-]\d\d):?(\d\d)$', r'\1:\2', value).replace(' ', 'T', 1))
+    return parsed.strftime('%Y-%m-%dT%H:%M:%S.') + f'{parsed.microsecond // 1000:03d}Z'
+
+# X-Gitlab-Event of each object_kind, for payloads recorded without their headers
+webhook_events = {'pipeline': 'Pipeline Hook', 'build': 'Job Hook', 'deployment': 'Deployment Hook'}
+
+# Turn a Pipeline, Job or Deployment Hook payload into (project_id, records by kind), applying the same
+# push-down filters as the fetchers; other events, and records those filters exclude, give no records
+def normalize_webhook(event, payload, state=None):
+    records = {kind: [] for kind in record_types}
+    if event == 'Pipeline Hook':
+        project_id = payload['project']['id']
+        pipeline = payload['object_attributes']
+        if pipeline_ref and pipeline.get('ref') != pipeline_ref:
+            return project_id, records
+        created_at = webhook_time(pipeline['created_at'])
+        # The hook has no updated_at; a pipeline stops changing when it finishes
+        updated_at = webhook_time(pipeline.get('finished_at')) or created_at
+        records['pipelines'].append(Pipeline(pipeline['id'], sys.intern(pipeline['status']), created_at, updated_at))
+        for build in payload.get('builds') or []:
+            records['jobs'].append(Job(
+                build['id'], pipeline['id'], sys.intern(build['name']), sys.intern(build['status']),
+                webhook_time(build['created_at']), webhook_time(build.get('started_at')), webhook_time(build.get('finished_at'))
+            ))
+    elif event == 'Job Hook':
+        project_id = payload['project_id']
+        if pipeline_ref and payload.get('ref') != pipeline_ref:
+            return project_id, records
+        records['jobs'].append(Job(
+            payload['build_id'], payload['pipeline_id'], sys.intern(payload['build_name']), sys.intern(payload['build_status']),
+            webhook_time(payload['build_created_at']), webhook_time(payload.get('build_started_at')), webhook_time(payload.get('build_finished_at'))
+        ))
+    elif event == 'Deployment Hook':
+        project_id = payload['project']['id']
+        if (deployment_environment and payload.get('environment') != deployment_environment) or \
+                (deployment_status and payload['status'] != deployment_status):
+            return project_id, records
+        # The hook fires on every status change; created_at is when the deployment was first seen
+        changed_at = webhook_time(payload['status_changed_at'])
+        known = state.get(project_id, 'deployments', payload['deployment_id']) if state is not None else None
+        # The hook has no full SHA, only short_sha and a commit_url that ends in it; the stored copy's is kept otherwise
+        commit = re.search(r'/commit/([0-9a-f]{40})$', payload.get('commit_url') or '')
+        sha = commit.group(1) if commit else known.sha if known else None
+        records['deployments'].append(Deployment(
+            payload['deployment_id'], known.created_at if known else changed_at, changed_at,
+            sys.intern(payload['status']), sys.intern(payload['environment']), sha
+        ))
+    else:
+        return None, records
+    return project_id, records
+
+# Stores webhook records into a SyncState, next to the polled ones, and reports the projects they touched
+class WebhookIngestor:
+    def __init__(self, state, on_update=None):
+        self.state = state
+        self.on_update = on_update
+
+    # Returns the number of records stored
+    def ingest(self, event, payload):
+        project_id, records = normalize_webhook(event, payload, self.state)
+        stored = sum(len(batch) for batch in records.values())
+        if not stored:
+            return 0
+        self.state.upsert(project_id, 'pipelines', records['pipelines'], 'updated_at')
+        self.state.upsert(project_id, 'deployments', records['deployments'], 'updated_at')
+        self.state.upsert(project_id, 'jobs', records['jobs'], 'created_at', parent_field='pipeline_id')
+        if self.on_update:
+            self.on_update(project_id)
+        return stored
+
+# Recorded webhooks from a file: a JSON object, a JSON array or JSON lines, each entry either a bare
+# payload or {"headers": {...}, "body": {...}}; yields (event, payload) in order
+def read_recorded_webhooks(path):
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        entries = json.loads(text)
+    else:
+        try:
+            entries = [json.loads(text)]
+        except ValueError:
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for entry in entries:
+        payload = entry.get('body', entry)
+        headers = CaseInsensitiveDict(entry.get('headers') or {})
+        yield headers.get('X-Gitlab-Event') or webhook_events.get(payload.get('object_kind')), payload
 
-# Display the aggregated metrics
-print("Daily Metrics:")
-print(daily_metrics_df)
-print("\nMonthly Metrics:")
-print(monthly_metrics_df)
+# POST recorded webhooks to a listener (e.g. serve's /webhook) as GitLab would send them
+def replay_webhooks(url, paths, token=None):
+    sent = 0
+    with requests.Session() as session:
+        for path in paths:
+            for event, payload in read_recorded_webhooks(path):
+                headers = {'X-Gitlab-Event': event or ''}
+                if token:
+                    headers['X-Gitlab-Token'] = token
+                response = session.post(url, json=payload, headers=headers, timeout=request_timeout)
+                if response.status_code >= 300:
+                    print(f"{path}: {event} rejected with {response.status_code}: {response.text}")
+                sent += 1
+    return sent
+
+# Granularities accepted by the query API, as rollup frequencies (None: one row for the whole window)
+granularities = {'day': 'D', 'week': 'W', 'month': 'M', 'window': None}
+
+# Long-running service: keeps a group's daily totals (sums, counts and sketches) for the last history_days
+# in memory, refreshes them incrementally on a schedule, and answers queries from memory. Webhooks update
+# the projects they touch between refreshes, and projects kept current by webhooks are polled only every
+# reconcile_interval to reconcile what the webhooks missed.
+class MetricsService:
+    def __init__(self, group_id, history_days=service_history_days, refresh_interval=service_refresh_interval, workers=None, skip_archived=False,
+                 reconcile_interval=service_reconcile_interval, webhooks_configured=service_webhooks_configured):
+        self.group_id = group_id
+        self.history_days = history_days
+        self.refresh_interval = refresh_interval
+        self.reconcile_interval = reconcile_interval
+        self.webhooks_configured = webhooks_configured
+        self.workers = workers
+        self.skip_archived = skip_archived
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.daily_totals = None
+        self.project_ids = []
+        self.refreshed_at = None
+        self.last_error = None
+        self.state = SyncState(state_path)
+        self.ingestor = WebhookIngestor(self.state, self.mark_dirty)
+        self.dirty = set()
+        self.dirty_event = threading.Event()
+        # time.monotonic() of each project's latest webhook and latest poll
+        self.webhook_at = {}
+        self.polled_at = {}
+
+    # Projects to poll now: those without recent webhooks, and the others once every reconcile_interval.
+    # With webhooks_configured every project counts as sending webhooks, quiet ones included.
+    def projects_to_poll(self, project_ids, now):
+        with self.lock:
+            return [
+                project_id for project_id in project_ids
+                if not self.webhooks_configured and now - self.webhook_at.get(project_id, float('-inf')) >= self.reconcile_interval
+                or now - self.polled_at.get(project_id, float('-inf')) >= self.reconcile_interval
+            ]
+
+    # Recompute the daily totals, fetching only what changed since the last refresh for the projects due a
+    # poll and totaling the others' stored records; on failure the previous totals keep being served
+    def refresh(self):
+        now = datetime.now(timezone.utc)
+        start_date = (now - timedelta(days=self.history_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        end_date = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        try:
+            with run_metrics.stage('service_refresh'):
+                project_ids = [project['id'] for project in iter_group_projects(self.group_id, self.skip_archived)]
+                polled_at = time.monotonic()
+                polled = self.projects_to_poll(project_ids, polled_at)
+                frames = [collect_daily_totals(polled, start_date, end_date, self.workers, self.state)]
+                stored = set(project_ids) - set(polled)
+                if stored:
+                    records = {project_id: {kind: self.state.load(project_id, kind) for kind in record_types} for project_id in stored}
+                    frames.append(total_records(records, start_date, end_date))
+                daily_totals = pd.concat(frames, ignore_index=True)
+        except Exception as err:
+            print(f"Refresh failed, serving the previous totals: {err}")
+            with self.lock:
+                self.last_error = str(err)
+            return
+        with self.lock:
+            self.daily_totals = daily_totals
+            self.project_ids = project_ids
+            self.polled_at.update(dict.fromkeys(polled, polled_at))
+            self.refreshed_at = now
+            self.last_error = None
+
+    def run_refresh_loop(self):
+        while not self.stopped.is_set():
+            self.refresh()
+            self.stopped.wait(self.refresh_interval)
+
+    def mark_dirty(self, project_id):
+        with self.lock:
+            self.dirty.add(project_id)
+            self.webhook_at[project_id] = time.monotonic()
+        self.dirty_event.set()
+
+    # Recompute the daily totals of the given projects from their stored records, without fetching
+    def update_projects(self, project_ids):
+        with self.lock:
+            known = set(self.project_ids)
+            loaded = self.daily_totals is not None
+        # Until the first refresh there is nothing to update, and projects outside the group are ignored
+        project_ids = [project_id for project_id in project_ids if project_id in known]
+        if not loaded or not project_ids:
+            return
+        now = datetime.now(timezone.utc)
+        start_date = (now - timedelta(days=self.history_days)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        end_date = now.strftime('%Y-%m-%dT%H:%M:%SZ')
+        with run_metrics.stage('service_update'):
+            records = {project_id: {kind: self.state.load(project_id, kind) for kind in record_types} for project_id in project_ids}
+            totals = total_records(records, start_date, end_date)
+        with self.lock:
+            kept = self.daily_totals[~self.daily_totals['project_id'].isin(project_ids)]
+            self.daily_totals = pd.concat([kept, totals], ignore_index=True)
+
+    # Apply webhook updates in batches, so a burst of events recomputes each project once
+    def run_update_loop(self):
+        while not self.stopped.is_set():
+            self.dirty_event.wait()
+            self.stopped.wait(webhook_batch_seconds)
+            self.dirty_event.clear()
+            with self.lock:
+                project_ids, self.dirty = self.dirty, set()
+            try:
+                self.update_projects(project_ids)
+            except Exception as err:
+                print(f"Webhook update failed for projects {sorted(project_ids)}: {err}")
+
+    def start(self):
+        threading.Thread(target=self.run_update_loop, name='dora-webhooks', daemon=True).start()
+        thread = threading.Thread(target=self.run_refresh_loop, name='dora-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+        self.dirty_event.set()
+
+    def close(self):
+        self.stop()
+        self.state.close()
+
+    # Metrics for one project (or the whole group when project_id is None) over [start, end], per
+    # granularity ('day', 'week', 'month' or 'window'); the window defaults to the last 30 days
+    def query(self, project_id=None, start=None, end=None, granularity='window'):
+        if granularity not in granularities:
+            raise ValueError(f"Unknown granularity '{granularity}'; use one of {', '.join(granularities)}")
+        with self.lock:
+            daily_totals = self.daily_totals
+        if daily_totals is None:
+            raise LookupError("Metrics are not loaded yet")
+
+        end = pd.Timestamp(end).tz_localize(None) if end else daily_totals['date'].max()
+        start = pd.Timestamp(start).tz_localize(None) if start else end - pd.Timedelta(days=29)
+        if start < daily_totals['date'].min():
+            raise ValueError(f"Only the last {self.history_days} days are kept; start is before {daily_totals['date'].min():%Y-%m-%d}")
+        selected = daily_totals[daily_totals['date'].between(start.floor('D'), end)]
+        if project_id is not None:
+            selected = selected[selected['project_id'] == project_id]
+            if selected.empty:
+                raise LookupError(f"Project {project_id} is not part of group {self.group_id}")
+
+        freq = granularities[granularity]
+        if project_id is None:
+            return group_metrics(selected, freq)
+        if granularity == 'day':
+            return build_report(selected)
+        return totals_to_metrics(rollup_totals(selected, freq))
+
+    def health(self):
+        with self.lock:
+            return {
+                'group_id': self.group_id,
+                'projects': len(self.project_ids),
+                'refreshed_at': self.refreshed_at.isoformat(timespec='seconds') if self.refreshed_at else None,
+                'last_error': self.last_error
+            }
+
+# JSON rows of a metrics frame, with dates and periods as strings
+def frame_to_json(df):
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.PeriodDtype):
+            df[column] = df[column].astype(str)
+        elif pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+    return df.to_json(orient='records').encode()
+
+# Query API of a MetricsService:
+#   GET /dora?project=ID&start=2024-01-01&end=2024-01-31&granularity=day|week|month|window
+#       (without project: the whole group)
+#   GET /projects, GET /health, and GET /metrics for the run metrics in Prometheus text format
+#   POST /webhook for GitLab Pipeline, Job and Deployment Hooks
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    secret = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send(status, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/dora':
+                if self.service.health()['refreshed_at'] is None:
+                    self.send_error_json(503, "Metrics are not loaded yet")
+                    return
+                project_id = int(query['project']) if 'project' in query else None
+                metrics = self.service.query(project_id, query.get('start'), query.get('end'), query.get('granularity', 'window'))
+                self.send(200, frame_to_json(metrics))
+            elif url.path == '/projects':
+                with self.service.lock:
+                    self.send(200, json.dumps(self.service.project_ids).encode())
+            elif url.path == '/health':
+                health = self.service.health()
+                self.send(200 if health['refreshed_at'] else 503, json.dumps(health).encode())
+            elif url.path == '/metrics':
+                self.send(200, run_metrics.prometheus().encode(), 'text/plain; version=0.0.4')
+            else:
+                self.send_error_json(404, f'No such endpoint: {url.path}')
+        except LookupError as err:
+            self.send_error_json(404, str(err))
+        except ValueError as err:
+            self.send_error_json(400, str(err))
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/webhook':
+            self.send_error_json(404, f'No such endpoint: {self.path}')
+            return
+        if self.secret and not hmac.compare_digest(self.headers.get('X-Gitlab-Token', ''), self.secret):
+            self.send_error_json(401, 'Invalid X-Gitlab-Token')
+            return
+        event = self.headers.get('X-Gitlab-Event', '')
+        try:
+            payload = json_loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            stored = self.service.ingestor.ingest(event, payload)
+        except (ValueError, KeyError, TypeError) as err:
+            self.send_error_json(400, f'Malformed {event or "webhook"} payload: {err}')
+            return
+        self.send(200, json.dumps({'event': event, 'records': stored}).encode())
+
+# Whether a listen address only accepts connections from this machine
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# Run a MetricsService for a group and serve its query API and webhook endpoint until interrupted
+def serve(group_id, host=service_host, port=service_port, secret=webhook_secret, **service_options):
+    # Without a secret anyone who can reach /webhook can write records, so only this machine may
+    if not secret and not is_loopback(host):
+        raise ValueError(f"Refusing to accept unauthenticated webhooks on {host}; set GITLAB_WEBHOOK_SECRET or listen on a loopback address")
+    service = MetricsService(group_id, **service_options)
+    service.start()
+    handler = type('BoundMetricsRequestHandler', (MetricsRequestHandler,), {'service': service, 'secret': secret})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Serving DORA metrics for group {group_id} on http://{host}:{server.server_port}/dora")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+def print_reports(daily_metrics_df, monthly_metrics_df):
+    # Display the aggregated metrics
+    print("Daily Metrics:")
+    print(daily_metrics_df)
+    print("\nMonthly Metrics:")
+    print(monthly_metrics_df)
+
+    # Save the metrics to CSV files for further analysis
+    daily_metrics_df.to_csv('daily_dora_metrics.csv', index=False)
+    monthly_metrics_df.to_csv('monthly_dora_metrics.csv', index=False)
+
+# Command line: report (single process), shard (one worker's partial), merge (partials into reports),
+# local (every shard as a local process, then merge), serve (service mode with the query API and webhook
+# endpoint) and replay (send recorded webhooks to a listener)
+def main(argv=None):
+    global access_token, base_url
+    now = datetime.now(timezone.utc)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--group', default='YOUR_GROUP_ID_HERE', help='GitLab group ID')  # Replace with your GitLab group ID
+    common.add_argument('--base-url', default=base_url)
+    common.add_argument('--workers', type=int)
+    common.add_argument('--skip-archived', action='store_true')
+    window = argparse.ArgumentParser(add_help=False)
+    window.add_argument('--start', default=(now - timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%SZ'), help='window start (default: 30 days ago)')
+    window.add_argument('--end', default=now.strftime('%Y-%m-%dT%H:%M:%SZ'), help='window end (default: now)')
+    window.add_argument('--stream', action='store_true')
+    window.add_argument('--backend', choices=['rest', 'graphql'], default='rest')
+    # The settings of the same names above; shards are passed on whatever the local command was given
+    settings = argparse.ArgumentParser(add_help=False)
+    settings.add_argument('--cache-path', default=cache_path, help='response cache file (default: no cache)')
+    settings.add_argument('--deployment-environment', default=deployment_environment, help='count deployments to this environment only')
+    settings.add_argument('--deployment-status', default=deployment_status, help='count deployments with this status only')
+    settings.add_argument('--pipeline-ref', default=pipeline_ref, help='count pipelines on this ref only')
+    settings.add_argument('--incident-source', choices=['jobs', 'deployments'], default=incident_source)
+    settings.add_argument('--lead-time-source', choices=['pipelines', 'commits'], default=lead_time_source)
+    settings.add_argument('--commit-cache-path', default=commit_cache_path)
+
+    parser = argparse.ArgumentParser(description='DORA metrics for a GitLab group')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser('report', parents=[common, window, settings], help='compute the reports in this process')
+    report.add_argument('--incremental', action='store_true', help='fetch only what changed since the last run')
+    report.add_argument('--state-path', default=state_path, help='records and watermarks kept by --incremental runs')
+    report.add_argument('--store', metavar='DIR', help='also write the fetched records into the Parquet store in DIR')
+    report.add_argument('--from-store', action='store_true', help='compute from the records in --store alone, without calling GitLab')
+    report.add_argument('--metrics-json', metavar='PATH', help="write the run's request and stage timings to PATH as JSON")
+    report.add_argument('--metrics-prom', metavar='PATH', help="write the run's request and stage timings to PATH in Prometheus text format")
+    shard = commands.add_parser('shard', parents=[common, window, settings], help="compute one shard's partial aggregate")
+    shard.add_argument('--shard', type=int, required=True)
+    shard.add_argument('--shards', type=int, required=True)
+    shard.add_argument('--output', required=True, help='partial aggregate file to write')
+    merge = commands.add_parser('merge', help='merge partial aggregates into the reports')
+    merge.add_argument('partials', nargs='+')
+    local = commands.add_parser('local', parents=[common, window, settings], help='run every shard as a local process, then merge')
+    local.add_argument('--shards', type=int, default=os.cpu_count())
+    local.add_argument('--partials-dir', default='dora_partials')
+    service = commands.add_parser('serve', parents=[common, settings], help='keep metrics warm in memory and answer queries over HTTP')
+    service.add_argument('--host', default=service_host)
+    service.add_argument('--port', type=int, default=service_port)
+    service.add_argument('--history-days', type=int, default=service_history_days)
+    service.add_argument('--refresh-interval', type=int, default=service_refresh_interval, help='seconds between refreshes')
+    service.add_argument('--reconcile-interval', type=int, default=service_reconcile_interval,
+                         help='seconds between polls of projects that are sending webhooks')
+    service.add_argument('--webhooks-configured', action='store_true', help='the whole group sends webhooks, so poll every project only every --reconcile-interval')
+    replay = commands.add_parser('replay', help='POST recorded webhook payloads to a listener')
+    replay.add_argument('url', help='listener URL, e.g. http://127.0.0.1:8080/webhook')
+    replay.add_argument('recordings', nargs='+', help='JSON or JSON lines files of recorded webhooks')
+    args = parser.parse_args(argv)
+    if args.command == 'report' and args.from_store and not args.store:
+        parser.error('--from-store needs --store')
+
+    access_token = os.environ.get('GITLAB_TOKEN', access_token)
+    # The webhook secret also comes from the environment, like the token
+    secret = os.environ.get('GITLAB_WEBHOOK_SECRET', webhook_secret)
+    if args.command == 'merge':
+        print_reports(*merge_partials(args.partials))
+        return
+    if args.command == 'replay':
+        print(f"Replayed {replay_webhooks(args.url, args.recordings, secret)} webhooks")
+        return
+    base_url = args.base_url
+    apply_settings(args)
+
+    if args.command == 'shard':
+        run_shard(args.group, args.start, args.end, args.shard, args.shards, args.output, args.workers, args.skip_archived, args.stream, args.backend)
+    elif args.command == 'local':
+        print_reports(*run_local_shards(args, args.shards, args.partials_dir))
+    elif args.command == 'serve':
+        serve(args.group, args.host, args.port, secret, history_days=args.history_days, refresh_interval=args.refresh_interval,
+              workers=args.workers, skip_archived=args.skip_archived, reconcile_interval=args.reconcile_interval,
+              webhooks_configured=args.webhooks_configured)
+    else:
+        store = RawStore(args.store) if args.store else None
+        print_reports(*generate_reports(
+            args.group, args.start, args.end, args.workers, args.incremental, args.skip_archived, args.stream, store, args.from_store, args.backend
+        ))
+        # Request and stage timings of the run, as a JSON summary and in Prometheus text format, when asked for
+        run_metrics.write(args.metrics_json, args.metrics_prom)
 
-# Optionally, save the metrics to CSV files for further analysis
-daily_metrics_df.to_csv('daily_dora_metrics.csv', index=False)
-monthly_metrics_df.to_csv('monthly_dora_metrics.csv', index=False)
+if __name__ == '__main__':
+    main()